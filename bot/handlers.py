@@ -4,11 +4,17 @@ from telegram.error import TelegramError
 from telegram.ext import ContextTypes, Application, ConversationHandler, CommandHandler, MessageHandler, filters, CallbackQueryHandler
 from database import Database
 from bot.scraper import AspenScraper
-from bot.scheduler import fetch_and_notify_user
+from bot.scheduler import _tz, coalesce_messages, schedule_user_job
 # Email service removed - Telegram only notifications
+import asyncio
 import logging
+import random
+import re
 import time
-from functools import wraps
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from enum import IntEnum
+from functools import lru_cache, wraps
 import config
 
 # Configure logging
@@ -29,6 +35,11 @@ db = Database()
  SETUP_TIMEZONE, SETUP_NOTIFICATION_TIME,
  FEEDBACK_TYPE, FEEDBACK_MESSAGE) = range(11)
 
+class _UpdateKind(IntEnum):
+    """What an in-progress settings conversation is updating."""
+    NONE = 0
+    CREDENTIALS = 1
+
 # Common timezones for Aspen users
 COMMON_TIMEZONES = {
     "🇺🇸 Eastern": "America/New_York",
@@ -43,10 +54,349 @@ COMMON_TIMEZONES = {
     "🇨🇦 Pacific": "America/Vancouver"
 }
 
+# Reverse lookup from IANA timezone to display name
+TIMEZONE_TO_DISPLAY = {tz: display for display, tz in COMMON_TIMEZONES.items()}
+
+# Static setup and settings keyboards, built once since they only depend on constants
+_SETUP_INITIAL_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🌍 Change Timezone", callback_data="setup_timezone")],
+    [InlineKeyboardButton("⏰ Change Time", callback_data="setup_notification_time")],
+    [InlineKeyboardButton("✅ Keep Defaults", callback_data="setup_complete")]
+])
+_SETUP_TIMEZONE_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(display_name, callback_data=f"setup_timezone_{timezone}")]
+     for display_name, timezone in COMMON_TIMEZONES.items()]
+    + [[InlineKeyboardButton("❌ Cancel", callback_data="setup_complete")]]
+)
+_SETTINGS_TIMEZONE_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(display_name, callback_data=f"timezone_{timezone}")]
+     for display_name, timezone in COMMON_TIMEZONES.items()]
+    + [[InlineKeyboardButton("❌ Cancel", callback_data="cancel_timezone")]]
+)
+_DELETE_CONFIRM_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("✅ Yes, Delete", callback_data="confirm_delete")],
+    [InlineKeyboardButton("❌ Cancel", callback_data="cancel_delete")]
+])
+_SETUP_NEXT_STEP_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⏰ Set Notification Time", callback_data="setup_notification_time")],
+    [InlineKeyboardButton("✅ Complete Setup", callback_data="setup_complete")]
+])
+
+# Message templates, filled in with str.format by the handlers
+_START_RETURNING_TMPL = (
+    "👋 Welcome back, {name}!\n\n"
+    "Your chat ID is: {chat_id}\n\n"
+    "Your account is already set up. Use /grades to check your grades or /settings to manage your account."
+)
+_START_NEW_USER_TMPL = (
+    "👋 Hello {name}! Welcome to Aspen Grade Monitor!\n\n"
+    "Your chat ID is: {chat_id}\n\n"
+    "I'm here to help you keep track of your CPS grades and assignments from Aspen. 📚\n\n"
+    "🔒 <b>Your data is secure:</b>\n"
+    "• Credentials are encrypted and protected\n"
+    "• Your privacy is our priority\n"
+    "• You control your account completely\n\n"
+    "<b>To get started:</b>\n"
+    "🔐 /register - Set up your Aspen account\n"
+    "📊 /grades - Fetch your current grades\n"
+    "⚙️ /settings - Manage your account\n"
+    "❓ /help - Get help and instructions\n\n"
+    "<i>Ready to check your grades? Start with /register!</i>"
+)
+_NOT_REGISTERED_TEXT = (
+    "❌ You're not registered yet!\n\n"
+    "Please use /register to set up your Aspen account first."
+)
+_ALREADY_REGISTERED_TEXT = (
+    "You're already registered! Use /settings to update your information or /grades to check your grades."
+)
+_REGISTER_PROMPT_TEXT = (
+    "🔐 <b>Registration Process</b>\n\n"
+    "To get started, I'll need your Aspen credentials.\n\n"
+    "🛡️ <b>Your privacy is protected:</b>\n"
+    "• All data is encrypted and secure\n"
+    "• Credentials are never shared\n"
+    "• You control your account completely\n\n"
+    "Please send your <b>Aspen username</b>:"
+)
+_PASSWORD_SECURITY_NOTE = (
+    "🔒 <b>Your password is secure:</b>\n"
+    "• Encrypted and stored safely\n"
+    "• Never shared with anyone\n"
+    "• Only used to fetch your grades\n"
+    "• You can delete your account anytime"
+)
+_USERNAME_SAVED_TMPL = (
+    "✅ {label} saved: <code>{username}</code>\n\n"
+    "Now please send your <b>{password_label}</b>:\n\n"
+    + _PASSWORD_SECURITY_NOTE
+)
+_CREDENTIALS_UPDATED_TEXT = (
+    "✅ <b>Credentials Updated!</b>\n\n"
+    "Your Aspen credentials have been updated successfully!\n\n"
+    "You can now use:\n"
+    "📊 /grades - Check your grades with new credentials\n"
+    "⚙️ /settings - Manage your account\n\n"
+    "Your daily grade updates will continue as usual!"
+)
+_ACCOUNT_FAILED_TMPL = "❌ {action} failed. Please try again with /settings or /register."
+_SETUP_DEFAULTS_TMPL = (
+    "🎉 <b>Registration Complete!</b>\n\n"
+    "Your account has been set up successfully!\n\n"
+    "<b>Default Settings Applied:</b>\n"
+    "🌍 Timezone: 🇺🇸 Central (Chicago)\n"
+    "⏰ Notification Time: {notification_time}\n\n"
+    "<b>Would you like to customize these settings?</b>\n\n"
+    "Choose an option:"
+)
+_SETUP_COMPLETE_TMPL = (
+    "🎉 <b>Setup Complete!</b>\n\n"
+    "<b>Your Settings:</b>\n"
+    "🌍 Timezone: {timezone}\n"
+    "⏰ Notification Time: {notification_time}\n\n"
+    "<b>⏰ Important:</b>\n"
+    "Notifications may be delayed by 1-2 minutes to prevent server overload and ensure reliable service for all users.\n\n"
+    "<b>You can now use:</b>\n"
+    "📊 /grades - Check your grades\n"
+    "⚙️ /settings - Manage your account\n\n"
+    "I'll send you daily grade updates via Telegram!"
+)
+_SETTINGS_TMPL = (
+    "⚙️ <b>Account Settings</b>\n\n"
+    "👤 Username: <code>{username}</code>\n"
+    "🔔 Notifications: <code>Telegram</code>\n"
+    "📅 Created: <code>{created}</code>\n\n"
+    "⏰ <b>Note:</b> Notifications may be delayed by 1-2 minutes to ensure reliable service.\n\n"
+    "Choose an option below:"
+)
+_STATUS_TMPL = (
+    "📊 <b>Account Status</b>\n\n"
+    "✅ Account: Active\n"
+    "👤 Username: <code>{username}</code>\n"
+    "🔔 Notifications: <code>Telegram</code>\n"
+    "⏰ Notification Time: <code>{notification_time}</code> <code>{timezone}</code>\n"
+    "📅 Created: <code>{created}</code>\n"
+    "🔄 Last Updated: <code>{last_updated}</code>"
+)
+_DONATE_TEXT = (
+    "💝 <b>Support the Developer</b>\n\n"
+    "If you find this bot helpful, consider supporting its development!\n\n"
+    "Your support helps with:\n"
+    "• Server hosting costs\n"
+    "• Development time\n"
+    "• New features and improvements\n"
+    "• Bug fixes and maintenance\n\n"
+    f"🙏 <a href='{config.DONATION_URL}'>Click here to donate</a>\n\n"
+    "Thank you for your support! 💙"
+)
+_DONATE_THANKS_TEXT = (
+    "💝 <b>Support the Developer</b>\n\n"
+    "Thank you for using this bot! Your support is greatly appreciated. 💙"
+)
+_HELP_TEXT = (
+    "❓ <b>Help & Instructions</b>\n\n"
+    "<b>Available Commands:</b>\n"
+    "🔐 /register - Set up your Aspen account\n"
+    "📊 /grades - Check your current grades\n"
+    "⚙️ /settings - Manage your account\n"
+    "📊 /status - Check your account status\n"
+    "💝 /donate - Support the developer\n"
+    "💬 /feedback - Send feedback or report issues\n"
+    "❓ /help - Show this help message\n\n"
+    "<b>Getting Started:</b>\n"
+    "1. Use /register to set up your Aspen credentials\n"
+    "2. Use /grades to check your grades anytime\n"
+    "3. You'll receive daily grade updates via Telegram\n\n"
+    "⏰ <b>Notification Timing:</b>\n"
+    "• Notifications may be delayed by 1-2 minutes\n"
+    "• This prevents server overload and ensures reliability\n\n"
+    "🔒 <b>Security & Privacy:</b>\n"
+    "• Your credentials are encrypted and secure\n"
+    "• Data is never shared with third parties\n"
+    "• You can delete your account anytime\n\n"
+    "<b>Need Help?</b>\n"
+    "If you have issues, make sure your Aspen credentials are correct and try /register again."
+)
+_ADMIN_MENU_TEXT = (
+    "🛠️ <b>Admin Panel</b>\n\n"
+    "<b>Available Commands:</b>\n"
+    "📊 /admin stats - Show user statistics\n"
+    "👥 /admin users - Show user details\n"
+    "📢 /admin broadcast [message] - Send announcement\n"
+    "💬 /admin feedback - Show recent feedback messages\n\n"
+    "<b>Examples:</b>\n"
+    "• /admin stats\n"
+    "• /admin users\n"
+    "• /admin broadcast Hello everyone!\n"
+    "• /admin feedback"
+)
+_ADMIN_STATS_TMPL = (
+    "📈 <b>Admin Statistics</b>\n\n"
+    "👥 <b>Total Users:</b> {total_users}\n"
+    "🆕 <b>New Users (7 days):</b> {recent_users}\n\n"
+    "{time_chart}\n{tz_chart}"
+)
+_ADMIN_INVALID_TEXT = (
+    "❌ <b>Invalid subcommand</b>\n\n"
+    "Available: stats, users, broadcast, feedback\n"
+    "Example: /admin stats"
+)
+_BROADCAST_USAGE_TEXT = (
+    "📢 <b>Broadcast Message</b>\n\n"
+    "Usage: /admin broadcast <message>\n\n"
+    "Example: /admin broadcast Hello everyone! The bot will be updated tonight."
+)
+_FEEDBACK_IN_PROGRESS_TEXT = (
+    "💬 <b>Feedback Already Started</b>\n\n"
+    "You already have a feedback message in progress. Please send your feedback message now, or use /cancel to start over."
+)
+_FEEDBACK_PROMPT_TEXT = (
+    "💬 <b>Send Feedback</b>\n\n"
+    "We'd love to hear from you! Please type your feedback message below:\n\n"
+    "<i>Be as detailed as possible. Your feedback helps us improve the bot!</i>\n\n"
+    "Use /cancel to cancel."
+)
+_FEEDBACK_THANKS_TEXT = (
+    "✅ <b>Thank you for your feedback!</b>\n\n"
+    "Your feedback has been received and will be reviewed.\n\n"
+    "We appreciate you taking the time to help us improve the bot! 💙"
+)
+_UPDATE_CREDS_PROMPT_TEXT = (
+    "🔐 <b>Update Credentials</b>\n\n"
+    "Please send your new Aspen username:"
+)
+_SET_TIME_PROMPT_TEXT = (
+    "⏰ <b>Set Notification Time</b>\n\n"
+    "Please send the time when you want to receive daily grade notifications.\n\n"
+    "<b>Format examples:</b>\n"
+    "• <code>15:00</code> (3:00 PM)\n"
+    "• <code>08:30</code> (8:30 AM)\n"
+    "• <code>22:00</code> (10:00 PM)\n\n"
+    "Send the time in 24-hour format (HH:MM):"
+)
+_SELECT_TIMEZONE_TEXT = (
+    "🌍 <b>Select Your Timezone</b>\n\n"
+    "Choose your timezone for grade notifications:\n\n"
+    "<i>This ensures notifications arrive at the correct local time.</i>"
+)
+_TIMEZONE_CANCELLED_TEXT = (
+    "❌ Timezone selection cancelled.\n\n"
+    "Use /settings to try again."
+)
+_DELETE_CONFIRM_TEXT = (
+    "🗑️ <b>Delete Account</b>\n\n"
+    "⚠️ This will permanently delete your account and all data.\n"
+    "Are you sure you want to continue?"
+)
+_ACCOUNT_DELETED_TEXT = (
+    "🗑️ <b>Account Deleted</b>\n\n"
+    "Your account has been permanently deleted.\n"
+    "Use /register to create a new account."
+)
+_DELETE_CANCELLED_TEXT = (
+    "✅ Account deletion cancelled.\n\n"
+    "Your account remains active."
+)
+_TIMEZONE_UPDATED_TMPL = (
+    "✅ <b>Timezone Updated!</b>\n\n"
+    "Your timezone has been set to <b>{timezone}</b>.\n\n"
+    "Grade notifications will now be sent according to your local time.\n\n"
+    "Use /settings to change this anytime."
+)
+
+# Timezones resolved once at import
+_DEFAULT_TZ_NAME = 'America/Chicago'
+_DEFAULT_TZ = _tz(_DEFAULT_TZ_NAME)
+
+# Warm the cache with the selectable timezones so lookups never hit the tz database
+for _name in COMMON_TIMEZONES.values():
+    _tz(_name)
+del _name
+
+@lru_cache(maxsize=2048)
+def _fmt_utc(timestamp: str) -> str:
+    """Format a stored timestamp as UTC, treating naive values as Chicago local time."""
+    try:
+        dt = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=_DEFAULT_TZ)
+        return dt.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S UTC')
+    except Exception:
+        # Fallback to original format if parsing fails
+        return f"{timestamp} (local time)"
+
+def _fmt_created(created_at, tz_name: str, telegram_id: int) -> str:
+    """Format a user's created_at in their timezone; naive values are taken as UTC."""
+    if created_at in (None, 'Unknown'):
+        return 'Unknown'
+    if created_at in (1, '1', ''):
+        return 'Recently registered'
+    try:
+        user_tz = _tz(tz_name) if tz_name else _DEFAULT_TZ
+        if isinstance(created_at, int):
+            created_dt = datetime.fromtimestamp(created_at).replace(tzinfo=user_tz)
+        else:
+            if isinstance(created_at, str):
+                created_at = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+            created_dt = created_at if created_at.tzinfo else created_at.replace(tzinfo=timezone.utc)
+        return created_dt.astimezone(user_tz).strftime('%Y-%m-%d %H:%M:%S %Z')
+    except Exception as e:
+        logger.error(f"Error formatting timestamp for user {telegram_id}: {e}")
+        return f"Invalid timestamp: {created_at}"
+
+@lru_cache(maxsize=64)
+def _tz_label(name: str) -> str:
+    """Render an IANA timezone name for display, e.g. 'America / Los Angeles'."""
+    return name.replace('_', ' ').replace('/', ' / ')
+
+# Admin access check
+_ADMIN_IDS = frozenset(config.ADMIN_USER_IDS)
+_ADMIN_DENIED_MSG = (
+    "❌ <b>Access Denied</b>\n\n"
+    "This command is restricted to administrators only."
+)
+
+# Longest feedback message accepted, safely under Telegram's 4096-char limit for the admin alert
+FEEDBACK_MAX_LENGTH = 3500
+
+# Feedback type emojis
+_TYPE_EMOJIS = {
+    'bug': '🐛',
+    'feature': '💡',
+    'question': '❓',
+    'general': '💝'
+}
+_DEFAULT_EMOJI = '💬'
+
+# 24-hour HH:MM notification time
+_TIME_RE = re.compile(r'^([01]?[0-9]|2[0-3]):([0-5][0-9])$')
+
+# Seconds a memoized user row stays valid within chat_data
+USER_CACHE_TTL = 5
+
+# Reuse a user's scraper (and its Aspen session) across /grades calls
+SCRAPER_CACHE_TTL = 900
+SCRAPER_CACHE_MAX = 1024
+_scraper_cache = {}
+
+# In-flight /grades scrapes keyed by telegram ID, shared by concurrent callers
+_inflight_scrapes = {}
+
+# Fire-and-forget tasks, referenced here so they aren't garbage collected mid-flight
+_background_tasks = set()
+
+# Fan-out sends: concurrent requests in flight, and Telegram's ~30 msg/s bot limit
+SEND_CONCURRENCY = 25
+SEND_RATE = 30
+# How long shutdown waits for queued sends before giving up on them
+SEND_DRAIN_TIMEOUT = 10
+
+# Queued (chat_id, text, label) sends, drained by one long-lived worker task
+_send_queue = asyncio.Queue()
+_send_worker_task = None
+
 def generate_random_notification_time():
     """Generate a random time between 12:00 and 20:00 at 15-minute intervals"""
-    import random
-
     # Random hour between 12 and 19 (12:00 to 19:45)
     hour = random.randint(12, 19)
 
@@ -56,18 +406,149 @@ def generate_random_notification_time():
     # Format as HH:MM
     return f"{hour:02d}:{minute:02d}"
 
+async def _load_user_ctx(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
+    """Load user and settings in one query, memoized in chat_data for a short window."""
+    cache = context.chat_data.get('_cache') if context.chat_data is not None else None
+    now = time.monotonic()
+    if cache and cache['chat_id'] == chat_id and now - cache['ts'] < USER_CACHE_TTL:
+        return cache['user']
+
+    user = await asyncio.to_thread(db.get_user_with_settings, chat_id)
+    if context.chat_data is not None:
+        context.chat_data['_cache'] = {'chat_id': chat_id, 'user': user, 'ts': now}
+    return user
+
+def _invalidate_user_ctx(context: ContextTypes.DEFAULT_TYPE):
+    """Drop the memoized user row after a write."""
+    if context.chat_data is not None:
+        context.chat_data.pop('_cache', None)
+
+def _get_scraper(user):
+    """Return a cached AspenScraper for the user, rebuilding it when stale or credentials changed."""
+    now = time.monotonic()
+    cached = _scraper_cache.get(user['telegram_id'])
+    if cached:
+        scraper, created = cached
+        if (now - created < SCRAPER_CACHE_TTL
+                and scraper.username == user['aspen_username']
+                and scraper.password == user['aspen_password']):
+            return scraper
+
+    if len(_scraper_cache) >= SCRAPER_CACHE_MAX:
+        # Drop expired scrapers, then the oldest one if still full
+        for telegram_id in [k for k, (_, c) in _scraper_cache.items() if now - c >= SCRAPER_CACHE_TTL]:
+            del _scraper_cache[telegram_id]
+        if len(_scraper_cache) >= SCRAPER_CACHE_MAX:
+            _scraper_cache.pop(next(iter(_scraper_cache)))
+
+    scraper = AspenScraper(user['aspen_username'], user['aspen_password'])
+    _scraper_cache[user['telegram_id']] = (scraper, now)
+    return scraper
+
+def _scrape_grades(user) -> asyncio.Future:
+    """Start a grade scrape for the user, or join the one already in flight."""
+    telegram_id = user['telegram_id']
+    task = _inflight_scrapes.get(telegram_id)
+    if task is None:
+        scraper = _get_scraper(user)
+        # Scrape in a worker thread so the event loop keeps serving other users
+        task = asyncio.ensure_future(asyncio.to_thread(scraper.fetch_formatted_grades))
+        _inflight_scrapes[telegram_id] = task
+
+        def _done(t):
+            _inflight_scrapes.pop(telegram_id, None)
+            # Don't hand a scraper in an unknown state to the next /grades call
+            if t.cancelled() or t.exception() is not None:
+                _scraper_cache.pop(telegram_id, None)
+
+        task.add_done_callback(_done)
+    return task
+
+async def _send_to_many(bot, chat_ids, text: str, label: str) -> list:
+    """Send the same message to many chats concurrently, paced under the bot rate limit."""
+    semaphore = asyncio.Semaphore(SEND_CONCURRENCY)
+
+    async def send_one(index, chat_id):
+        # Stagger start times so no more than SEND_RATE sends begin per second
+        await asyncio.sleep(index / SEND_RATE)
+        async with semaphore:
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML')
+                return True
+            except Exception as e:
+                logger.error(f"Failed to send {label} to {chat_id}: {e}")
+                return False
+
+    return await asyncio.gather(*(send_one(i, chat_id) for i, chat_id in enumerate(chat_ids)))
+
+def _spawn(coro, label: str) -> asyncio.Task:
+    """Run a coroutine in the background, keeping it referenced until done and logging its outcome."""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+
+    def _done(task):
+        _background_tasks.discard(task)
+        if task.cancelled():
+            logger.warning("%s cancelled", label)
+        elif task.exception():
+            logger.error("%s error: %s", label, task.exception())
+        else:
+            logger.info("%s result: %s", label, task.result())
+
+    task.add_done_callback(_done)
+    return task
+
+async def _send_worker(bot):
+    """Drain the send queue for the life of the bot, starting at most SEND_RATE sends per second."""
+    semaphore = asyncio.Semaphore(SEND_CONCURRENCY)
+    in_flight = set()
+
+    async def deliver(chat_id, text, label):
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode='HTML')
+        except Exception as e:
+            logger.error(f"Failed to send {label} to {chat_id}: {e}")
+        finally:
+            semaphore.release()
+            _send_queue.task_done()
+
+    while True:
+        chat_id, text, label = await _send_queue.get()
+        await semaphore.acquire()
+        task = asyncio.create_task(deliver(chat_id, text, label))
+        in_flight.add(task)
+        task.add_done_callback(in_flight.discard)
+        await asyncio.sleep(1 / SEND_RATE)
+
+def _enqueue_sends(bot, chat_ids, text: str, label: str) -> int:
+    """Queue a message for many chats on the send worker, starting the worker if needed."""
+    global _send_worker_task
+    if _send_worker_task is None or _send_worker_task.done():
+        _send_worker_task = asyncio.create_task(_send_worker(bot))
+    for chat_id in chat_ids:
+        _send_queue.put_nowait((chat_id, text, label))
+    return len(chat_ids)
+
+async def drain_send_queue(application=None):
+    """On shutdown, let queued sends finish for up to SEND_DRAIN_TIMEOUT seconds, then stop the worker."""
+    global _send_worker_task
+    if _send_worker_task is None:
+        return
+    try:
+        await asyncio.wait_for(_send_queue.join(), SEND_DRAIN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("Shutting down with %d queued messages still unsent", _send_queue.qsize())
+    _send_worker_task.cancel()
+    _send_worker_task = None
+
 def admin_required(func):
     """Decorator to require admin privileges for certain commands."""
     @wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
         user_id = update.effective_user.id
 
-        if user_id not in config.ADMIN_USER_IDS:
-            await update.message.reply_text(
-                "❌ <b>Access Denied</b>\n\n"
-                "This command is restricted to administrators only.",
-                parse_mode='HTML'
-            )
+        if user_id not in _ADMIN_IDS:
+            await update.message.reply_text(_ADMIN_DENIED_MSG, parse_mode='HTML')
             return
 
         return await func(update, context)
@@ -92,29 +573,14 @@ async def setup_commands(application: Application) -> None:
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
     chat_id = update.effective_chat.id
-    user = db.get_user(chat_id)
 
-    if user:
+    if await asyncio.to_thread(db.user_exists, chat_id):
         await update.message.reply_text(
-            f"👋 Welcome back, {update.effective_user.first_name}!\n\n"
-            f"Your chat ID is: {chat_id}\n\n"
-            f"Your account is already set up. Use /grades to check your grades or /settings to manage your account."
+            _START_RETURNING_TMPL.format(name=update.effective_user.first_name, chat_id=chat_id)
         )
     else:
         await update.message.reply_text(
-            f"👋 Hello {update.effective_user.first_name}! Welcome to Aspen Grade Monitor!\n\n"
-            f"Your chat ID is: {chat_id}\n\n"
-            "I'm here to help you keep track of your CPS grades and assignments from Aspen. 📚\n\n"
-            "🔒 <b>Your data is secure:</b>\n"
-            "• Credentials are encrypted and protected\n"
-            "• Your privacy is our priority\n"
-            "• You control your account completely\n\n"
-            "<b>To get started:</b>\n"
-            "🔐 /register - Set up your Aspen account\n"
-            "📊 /grades - Fetch your current grades\n"
-            "⚙️ /settings - Manage your account\n"
-            "❓ /help - Get help and instructions\n\n"
-            "<i>Ready to check your grades? Start with /register!</i>",
+            _START_NEW_USER_TMPL.format(name=update.effective_user.first_name, chat_id=chat_id),
             parse_mode='HTML'
         )
 
@@ -135,22 +601,11 @@ async def register(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     user_id = update.effective_user.id
 
     # Check if user already exists
-    if db.get_user(user_id):
-        await update.message.reply_text(
-            "You're already registered! Use /settings to update your information or /grades to check your grades."
-        )
+    if await asyncio.to_thread(db.user_exists, user_id):
+        await update.message.reply_text(_ALREADY_REGISTERED_TEXT)
         return ConversationHandler.END
 
-    await update.message.reply_text(
-        "🔐 <b>Registration Process</b>\n\n"
-        "To get started, I'll need your Aspen credentials.\n\n"
-        "🛡️ <b>Your privacy is protected:</b>\n"
-        "• All data is encrypted and secure\n"
-        "• Credentials are never shared\n"
-        "• You control your account completely\n\n"
-        "Please send your <b>Aspen username</b>:",
-        parse_mode='HTML'
-    )
+    await update.message.reply_text(_REGISTER_PROMPT_TEXT, parse_mode='HTML')
     return REGISTER_USERNAME
 
 async def register_username(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -159,68 +614,46 @@ async def register_username(update: Update, context: ContextTypes.DEFAULT_TYPE)
     context.user_data['aspen_username'] = username
 
     # Check if this is an update or new registration
-    is_update = context.user_data.get('updating') == 'credentials'
+    is_update = context.user_data.get('updating') == _UpdateKind.CREDENTIALS
 
-    if is_update:
-        await update.message.reply_text(
-            f"✅ New username saved: <code>{username}</code>\n\n"
-            "Now please send your <b>new Aspen password</b>:\n\n"
-            "🔒 <b>Your password is secure:</b>\n"
-            "• Encrypted and stored safely\n"
-            "• Never shared with anyone\n"
-            "• Only used to fetch your grades\n"
-            "• You can delete your account anytime",
-            parse_mode='HTML'
-        )
-        return SET_CREDENTIALS_PASSWORD
-    else:
-        await update.message.reply_text(
-            f"✅ Username saved: <code>{username}</code>\n\n"
-            "Now please send your <b>Aspen password</b>:\n\n"
-            "🔒 <b>Your password is secure:</b>\n"
-            "• Encrypted and stored safely\n"
-            "• Never shared with anyone\n"
-            "• Only used to fetch your grades\n"
-            "• You can delete your account anytime",
-            parse_mode='HTML'
-        )
-        return REGISTER_PASSWORD
+    await update.message.reply_text(
+        _USERNAME_SAVED_TMPL.format(
+            label="New username" if is_update else "Username",
+            password_label="new Aspen password" if is_update else "Aspen password",
+            username=username
+        ),
+        parse_mode='HTML'
+    )
+    return SET_CREDENTIALS_PASSWORD if is_update else REGISTER_PASSWORD
 
 async def register_password(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Store password and complete registration."""
     password = update.message.text.strip()
     context.user_data['aspen_password'] = password
 
+    # Check if this is an update or new registration
+    is_update = context.user_data.get('updating') == _UpdateKind.CREDENTIALS
+
     # Complete registration with Telegram notifications only
-    success = db.add_user(
+    success = await asyncio.to_thread(
+        db.add_user,
         telegram_id=update.effective_user.id,
         aspen_username=context.user_data['aspen_username'],
         aspen_password=context.user_data['aspen_password'],
         notification_method='telegram'
     )
+    _invalidate_user_ctx(context)
+    _scraper_cache.pop(update.effective_user.id, None)
 
     if success:
-        # Check if this is an update or new registration
-        is_update = context.user_data.get('updating') == 'credentials'
-
         if is_update:
-            await update.message.reply_text(
-                "✅ <b>Credentials Updated!</b>\n\n"
-                "Your Aspen credentials have been updated successfully!\n\n"
-                "You can now use:\n"
-                "📊 /grades - Check your grades with new credentials\n"
-                "⚙️ /settings - Manage your account\n\n"
-                "Your daily grade updates will continue as usual!",
-                parse_mode='HTML'
-            )
+            await update.message.reply_text(_CREDENTIALS_UPDATED_TEXT, parse_mode='HTML')
         else:
             # Start setup flow for new users
             await start_setup_flow(update, context)
     else:
-        action = "update" if context.user_data.get('updating') == 'credentials' else "registration"
-        await update.message.reply_text(
-            f"❌ {action.title()} failed. Please try again with /settings or /register."
-        )
+        action = "update" if is_update else "registration"
+        await update.message.reply_text(_ACCOUNT_FAILED_TMPL.format(action=action.title()))
 
     return ConversationHandler.END
 
@@ -230,23 +663,19 @@ async def start_setup_flow(update: Update, context: ContextTypes.DEFAULT_TYPE):
     random_time = generate_random_notification_time()
 
     # Set default timezone and time
-    db.update_user_timezone(update.effective_user.id, 'America/Chicago')
-    db.update_user_notification_time(update.effective_user.id, random_time)
+    await asyncio.to_thread(
+        db.update_user_settings,
+        update.effective_user.id,
+        timezone=_DEFAULT_TZ_NAME,
+        timezone_display=TIMEZONE_TO_DISPLAY[_DEFAULT_TZ_NAME],
+        notification_time=random_time
+    )
+    _invalidate_user_ctx(context)
 
     await update.message.reply_text(
-        f"🎉 <b>Registration Complete!</b>\n\n"
-        f"Your account has been set up successfully!\n\n"
-        f"<b>Default Settings Applied:</b>\n"
-        f"🌍 Timezone: 🇺🇸 Central (Chicago)\n"
-        f"⏰ Notification Time: {random_time}\n\n"
-        f"<b>Would you like to customize these settings?</b>\n\n"
-        f"Choose an option:",
+        _SETUP_DEFAULTS_TMPL.format(notification_time=random_time),
         parse_mode='HTML',
-        reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("🌍 Change Timezone", callback_data="setup_timezone")],
-            [InlineKeyboardButton("⏰ Change Time", callback_data="setup_notification_time")],
-            [InlineKeyboardButton("✅ Keep Defaults", callback_data="setup_complete")]
-        ])
+        reply_markup=_SETUP_INITIAL_KEYBOARD
     )
 
 async def setup_timezone_selection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -255,37 +684,24 @@ async def setup_timezone_selection(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
 
     if query.data == "setup_timezone":
-        # Create timezone selection keyboard
-        keyboard = []
-        for display_name, timezone in COMMON_TIMEZONES.items():
-            keyboard.append([InlineKeyboardButton(display_name, callback_data=f"setup_timezone_{timezone}")])
-
-        keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data="setup_complete")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-
         await query.edit_message_text(
-            "🌍 <b>Select Your Timezone</b>\n\n"
-            "Choose your timezone for grade notifications:\n\n"
-            "<i>This ensures notifications arrive at the correct local time.</i>",
+            _SELECT_TIMEZONE_TEXT,
             parse_mode='HTML',
-            reply_markup=reply_markup
+            reply_markup=_SETUP_TIMEZONE_KEYBOARD
         )
         return SETUP_TIMEZONE
 
     elif query.data.startswith("setup_timezone_"):
         timezone = query.data.replace("setup_timezone_", "")
 
-        # Update user's timezone
-        success = db.update_user_timezone(query.from_user.id, timezone)
+        # Update user's timezone along with its display name
+        success = await asyncio.to_thread(db.update_user_timezone, query.from_user.id, timezone, TIMEZONE_TO_DISPLAY.get(timezone))
+        _invalidate_user_ctx(context)
         chat_id = update.effective_chat.id if update.effective_chat else query.from_user.id
 
         if success:
             # Get display name for confirmation
-            timezone_display = "Unknown"
-            for display, tz in COMMON_TIMEZONES.items():
-                if tz == timezone:
-                    timezone_display = display
-                    break
+            timezone_display = TIMEZONE_TO_DISPLAY.get(timezone, "Unknown")
 
             confirmation_text = (
                 "✅ <b>Timezone Set!</b>\n\n"
@@ -295,29 +711,25 @@ async def setup_timezone_selection(update: Update, context: ContextTypes.DEFAULT
 
             try:
                 await query.edit_message_text(
-                    "✅ Timezone updated! Choose the next step:",
+                    confirmation_text,
                     parse_mode='HTML',
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("⏰ Set Notification Time", callback_data="setup_notification_time")],
-                        [InlineKeyboardButton("✅ Complete Setup", callback_data="setup_complete")]
-                    ])
+                    reply_markup=_SETUP_NEXT_STEP_KEYBOARD
                 )
             except TelegramError as e:
                 logger.warning(f"Failed to edit setup timezone confirmation for user {query.from_user.id}: {e}")
-
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=confirmation_text,
-                parse_mode='HTML'
-            )
+                await context.bot.send_message(
+                    chat_id=chat_id,
+                    text=confirmation_text,
+                    parse_mode='HTML',
+                    reply_markup=_SETUP_NEXT_STEP_KEYBOARD
+                )
         else:
             error_text = "❌ Failed to update timezone. Please try again with /settings."
             try:
                 await query.edit_message_text(error_text)
             except TelegramError as e:
                 logger.warning(f"Failed to edit setup timezone failure message for user {query.from_user.id}: {e}")
-
-            await context.bot.send_message(chat_id=chat_id, text=error_text)
+                await context.bot.send_message(chat_id=chat_id, text=error_text)
         return ConversationHandler.END
 
     elif query.data == "setup_complete":
@@ -355,10 +767,7 @@ async def setup_notification_time_input(update: Update, context: ContextTypes.DE
     time_input = update.message.text.strip()
 
     # Validate time format (HH:MM)
-    import re
-    time_pattern = r'^([01]?[0-9]|2[0-3]):([0-5][0-9])$'
-
-    if not re.match(time_pattern, time_input):
+    if not _TIME_RE.match(time_input):
         await update.message.reply_text(
             "❌ <b>Invalid time format!</b>\n\n"
             "Please use 24-hour format (HH:MM):\n"
@@ -371,7 +780,8 @@ async def setup_notification_time_input(update: Update, context: ContextTypes.DE
         return SETUP_NOTIFICATION_TIME
 
     # Update user's notification time
-    success = db.update_user_notification_time(update.effective_user.id, time_input)
+    success = await asyncio.to_thread(db.update_user_notification_time, update.effective_user.id, time_input)
+    _invalidate_user_ctx(context)
 
     if success:
         confirmation_text = (
@@ -395,29 +805,18 @@ async def setup_notification_time_input(update: Update, context: ContextTypes.DE
 async def complete_setup(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Complete the setup flow."""
     # Get current settings to show what was set
-    settings = db.get_user_settings(update.effective_user.id)
+    settings = await _load_user_ctx(context, update.effective_user.id)
     timezone_display = "🇺🇸 Central"  # Default
     notification_time = "15:00"  # Default
 
     if settings:
         notification_time = settings.get('notification_time', '15:00')
-        current_timezone = settings.get('timezone', 'America/Chicago')
-        for display, tz in COMMON_TIMEZONES.items():
-            if tz == current_timezone:
-                timezone_display = display
-                break
+        current_timezone = settings.get('timezone', _DEFAULT_TZ_NAME)
+        timezone_display = (settings.get('timezone_display')
+                            or TIMEZONE_TO_DISPLAY.get(current_timezone, timezone_display))
 
     await update.message.reply_text(
-        f"🎉 <b>Setup Complete!</b>\n\n"
-        f"<b>Your Settings:</b>\n"
-        f"🌍 Timezone: {timezone_display}\n"
-        f"⏰ Notification Time: {notification_time}\n\n"
-        f"<b>⏰ Important:</b>\n"
-        f"Notifications may be delayed by 1-2 minutes to prevent server overload and ensure reliable service for all users.\n\n"
-        f"<b>You can now use:</b>\n"
-        f"📊 /grades - Check your grades\n"
-        f"⚙️ /settings - Manage your account\n\n"
-        f"I'll send you daily grade updates via Telegram!",
+        _SETUP_COMPLETE_TMPL.format(timezone=timezone_display, notification_time=notification_time),
         parse_mode='HTML'
     )
 
@@ -426,10 +825,7 @@ async def set_notification_time(update: Update, context: ContextTypes.DEFAULT_TY
     time_input = update.message.text.strip()
 
     # Validate time format (HH:MM)
-    import re
-    time_pattern = r'^([01]?[0-9]|2[0-3]):([0-5][0-9])$'
-
-    if not re.match(time_pattern, time_input):
+    if not _TIME_RE.match(time_input):
         await update.message.reply_text(
             "❌ <b>Invalid time format!</b>\n\n"
             "Please use 24-hour format (HH:MM):\n"
@@ -442,23 +838,25 @@ async def set_notification_time(update: Update, context: ContextTypes.DEFAULT_TY
         return SET_NOTIFICATION_TIME
 
     # Update user's notification time
-    success = db.update_user_notification_time(update.effective_user.id, time_input)
+    success = await asyncio.to_thread(db.update_user_notification_time, update.effective_user.id, time_input)
+    _invalidate_user_ctx(context)
     chat_id = update.effective_chat.id
 
     if success:
         try:
-            # Reschedule the user's job with new time
-            await reschedule_user_job(update.effective_user.id, time_input, context)
-
             confirmation_text = (
                 "✅ <b>Notification Time Updated!</b>\n\n"
                 f"Your daily grade notifications will now be sent at <code>{time_input}</code>.\n\n"
                 "You can change this anytime in /settings."
             )
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=confirmation_text,
-                parse_mode='HTML'
+            # Reschedule the user's job with new time while confirming
+            await asyncio.gather(
+                reschedule_user_job(update.effective_user.id, context),
+                context.bot.send_message(
+                    chat_id=chat_id,
+                    text=confirmation_text,
+                    parse_mode='HTML'
+                )
             )
             logger.info(f"Successfully updated notification time for user {update.effective_user.id} to {time_input}")
         except Exception as e:
@@ -482,103 +880,45 @@ async def set_notification_time(update: Update, context: ContextTypes.DEFAULT_TY
 
     return ConversationHandler.END
 
-async def reschedule_user_job(telegram_id: int, notification_time: str, context: ContextTypes.DEFAULT_TYPE):
-    """Reschedule a user's notification job with new time."""
+async def reschedule_user_job(telegram_id: int, context: ContextTypes.DEFAULT_TYPE):
+    """Reschedule a user's notification job from their saved settings."""
     try:
-        import pytz
-        from datetime import time
-        import random
-
-        # Get user data
-        user = db.get_user(telegram_id)
+        user = await asyncio.to_thread(db.get_user_with_settings, telegram_id)
         if not user:
-            logger.error(f"User {telegram_id} not found for rescheduling")
+            logger.error("User %s not found for rescheduling", telegram_id)
             return
 
-        # Get user's timezone
-        settings = db.get_user_settings(telegram_id)
-        user_timezone = settings.get('timezone', 'America/Chicago') if settings else 'America/Chicago'
-        tz = pytz.timezone(user_timezone)
-
-        # Parse time (HH:MM format) and add random offset
-        hour, minute = map(int, notification_time.split(':'))
-        logger.info(f"User {telegram_id} - Reschedule: Original notification time: {notification_time} ({hour}:{minute:02d})")
-
-        # Add small random offset to prevent all users hitting at exact same time
-        # Use 0-59 second offset for minimal disruption to user's preferred time
-        random_offset_seconds = random.randint(0, 30)  # 0-30 second offset
-        logger.info(f"User {telegram_id} - Reschedule: Random offset: {random_offset_seconds} seconds")
-
-        # Calculate next run time in user's timezone, then convert to UTC
-        from datetime import datetime, timedelta
-        now = datetime.now(tz)
-        logger.info(f"User {telegram_id} - Reschedule: Current time in user timezone: {now.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-
-        scheduled_datetime = now.replace(hour=hour, minute=minute, second=random_offset_seconds, microsecond=0)
-        logger.info(f"User {telegram_id} - Reschedule: Scheduled datetime in user timezone: {scheduled_datetime.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-
-        # If the scheduled time has already passed today, schedule for tomorrow
-        if scheduled_datetime <= now:
-            scheduled_datetime += timedelta(days=1)
-            logger.info(f"User {telegram_id} - Reschedule: Time has passed today, scheduling for tomorrow: {scheduled_datetime.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-
-        # Convert to UTC for the scheduler (Telegram Bot expects UTC times)
-        scheduled_utc = scheduled_datetime.astimezone(pytz.UTC)
-        logger.info(f"User {telegram_id} - Reschedule: Converted to UTC: {scheduled_utc.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-
-        # Create timezone-naive time object in UTC for the scheduler
-        job_time = time(hour=scheduled_utc.hour, minute=scheduled_utc.minute, second=scheduled_utc.second)
-        logger.info(f"User {telegram_id} - Reschedule: Job time UTC (timezone-naive): {job_time}")
-
-        # Remove existing job(s) using PTB's API (not APScheduler's remove_job which requires job ID, not name)
-        job_name = f"grade_check_user_{telegram_id}"
-        current_jobs = context.job_queue.get_jobs_by_name(job_name)
-        for job in current_jobs:
-            job.schedule_removal()
-            logger.info(f"User {telegram_id} - Reschedule: Removed existing job")
-        if not current_jobs:
-            logger.info(f"User {telegram_id} - Reschedule: No existing job to remove")
-
-        # Create new job with updated time
-        context.job_queue.run_daily(
-            fetch_and_notify_user,
-            time=job_time,
-            name=job_name,
-            data=user,
-            job_kwargs={'next_run_time': scheduled_utc}
-        )
-
-        logger.info(f"User {telegram_id} - Reschedule: Job scheduled successfully")
-        logger.info(f"User {telegram_id} - Reschedule: Summary: {notification_time} {user_timezone} -> {job_time} UTC (next_run_time: {scheduled_utc.strftime('%Y-%m-%d %H:%M:%S %Z')})")
+        # Same scheduling path as startup; the job ID makes it replace the old job
+        schedule_user_job(context.job_queue, user)
 
     except Exception as e:
-        logger.error(f"Error rescheduling job for user {telegram_id}: {str(e)}", exc_info=True)
+        logger.error("Error rescheduling job for user %s: %s", telegram_id, e, exc_info=True)
 
 async def fetch_grades(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handler for /grades command - fetches current grades and assignments"""
     chat_id = update.effective_chat.id
-    user = db.get_user(chat_id)
+    user = await _load_user_ctx(context, chat_id)
 
     if not user:
-        await update.message.reply_text(
-            "❌ You're not registered yet!\n\n"
-            "Please use /register to set up your Aspen account first."
-        )
+        await update.message.reply_text(_NOT_REGISTERED_TEXT)
         return
 
-    # Send initial message
-    await context.bot.send_message(
+    # Send initial message while the scrape is already underway
+    placeholder = asyncio.create_task(context.bot.send_message(
         chat_id=chat_id,
         text="Fetching your grades... Please wait."
-    )
+    ))
 
     try:
-        # Initialize scraper with user's credentials
-        scraper = AspenScraper(user['aspen_username'], user['aspen_password'])
-        messages = scraper.fetch_formatted_grades()
+        # Repeated /grades calls while a scrape is running share its result;
+        # shield it so one caller going away doesn't cancel it for the others
+        _, messages = await asyncio.gather(
+            placeholder,
+            asyncio.shield(_scrape_grades(user))
+        )
 
-        # Send all messages
-        for message in messages:
+        # Send all messages in order; they are parts of one report
+        for message in coalesce_messages(messages):
             await context.bot.send_message(
                 chat_id=chat_id,
                 text=message,
@@ -594,26 +934,17 @@ async def fetch_grades(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user settings and management options."""
     chat_id = update.effective_chat.id
-    user = db.get_user(chat_id)
+    user = await _load_user_ctx(context, chat_id)
 
     if not user:
-        await update.message.reply_text(
-            "❌ You're not registered yet!\n\n"
-            "Please use /register to set up your Aspen account first."
-        )
+        await update.message.reply_text(_NOT_REGISTERED_TEXT)
         return ConversationHandler.END
 
-    # Get user settings to show current notification time and timezone
-    settings = db.get_user_settings(chat_id)
-    current_time = settings.get('notification_time', '15:00') if settings else '15:00'
-    current_timezone = settings.get('timezone', 'America/Chicago') if settings else 'America/Chicago'
+    current_time = user['notification_time']
+    current_timezone = user['timezone']
 
     # Convert timezone to display name
-    timezone_display = "Central"  # Default
-    for display, tz in COMMON_TIMEZONES.items():
-        if tz == current_timezone:
-            timezone_display = display
-            break
+    timezone_display = user['timezone_display'] or TIMEZONE_TO_DISPLAY.get(current_timezone, "Central")
 
     # Create settings keyboard
     keyboard = [
@@ -625,27 +956,10 @@ async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
     reply_markup = InlineKeyboardMarkup(keyboard)
 
     # Format created timestamp with timezone info
-    from datetime import datetime
-    import pytz
-
-    try:
-        created_dt = datetime.fromisoformat(user['created_at'].replace('Z', '+00:00'))
-        if created_dt.tzinfo is None:
-            local_tz = pytz.timezone('America/Chicago')
-            created_dt = local_tz.localize(created_dt).astimezone(pytz.UTC)
-        else:
-            created_dt = created_dt.astimezone(pytz.UTC)
-        created_utc = created_dt.strftime('%Y-%m-%d %H:%M:%S UTC')
-    except Exception:
-        created_utc = f"{user['created_at']} (local time)"
+    created_utc = _fmt_utc(user['created_at'])
 
     await update.message.reply_text(
-        f"⚙️ <b>Account Settings</b>\n\n"
-        f"👤 Username: <code>{user['aspen_username']}</code>\n"
-        f"🔔 Notifications: <code>Telegram</code>\n"
-        f"📅 Created: <code>{created_utc}</code>\n\n"
-        f"⏰ <b>Note:</b> Notifications may be delayed by 1-2 minutes to ensure reliable service.\n\n"
-        "Choose an option below:",
+        _SETTINGS_TMPL.format(username=user['aspen_username'], created=created_utc),
         parse_mode='HTML',
         reply_markup=reply_markup
     )
@@ -654,61 +968,30 @@ async def settings(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show user account status."""
     chat_id = update.effective_chat.id
-    user = db.get_user(chat_id)
+    user = await _load_user_ctx(context, chat_id)
 
     if not user:
-        await update.message.reply_text(
-            "❌ You're not registered yet!\n\n"
-            "Please use /register to set up your Aspen account first."
-        )
+        await update.message.reply_text(_NOT_REGISTERED_TEXT)
         return
 
-    # Get user settings for notification time and timezone
-    settings = db.get_user_settings(chat_id)
-    notification_time = settings.get('notification_time', '15:00') if settings else '15:00'
-    user_timezone = settings.get('timezone', 'America/Chicago') if settings else 'America/Chicago'
+    notification_time = user['notification_time']
+    user_timezone = user['timezone']
 
     # Format timezone for display
-    timezone_display = user_timezone.replace('_', ' ').replace('/', ' / ')
+    timezone_display = _tz_label(user_timezone)
 
     # Format timestamps with timezone info
-    from datetime import datetime
-    import pytz
-
-    try:
-        # Parse the stored timestamp and convert to UTC
-        created_dt = datetime.fromisoformat(user['created_at'].replace('Z', '+00:00'))
-        if created_dt.tzinfo is None:
-            # If no timezone info, assume local time and convert to UTC
-            local_tz = pytz.timezone('America/Chicago')  # Default timezone
-            created_dt = local_tz.localize(created_dt).astimezone(pytz.UTC)
-        else:
-            created_dt = created_dt.astimezone(pytz.UTC)
-
-        last_updated_dt = datetime.fromisoformat(user['last_updated'].replace('Z', '+00:00'))
-        if last_updated_dt.tzinfo is None:
-            local_tz = pytz.timezone('America/Chicago')
-            last_updated_dt = local_tz.localize(last_updated_dt).astimezone(pytz.UTC)
-        else:
-            last_updated_dt = last_updated_dt.astimezone(pytz.UTC)
-
-        # Format with UTC indicator
-        created_utc = created_dt.strftime('%Y-%m-%d %H:%M:%S UTC')
-        last_updated_utc = last_updated_dt.strftime('%Y-%m-%d %H:%M:%S UTC')
-
-    except Exception as e:
-        # Fallback to original format if parsing fails
-        created_utc = f"{user['created_at']} (local time)"
-        last_updated_utc = f"{user['last_updated']} (local time)"
+    created_utc = _fmt_utc(user['created_at'])
+    last_updated_utc = _fmt_utc(user['last_updated'])
 
     await update.message.reply_text(
-        f"📊 <b>Account Status</b>\n\n"
-        f"✅ Account: Active\n"
-        f"👤 Username: <code>{user['aspen_username']}</code>\n"
-        f"🔔 Notifications: <code>Telegram</code>\n"
-        f"⏰ Notification Time: <code>{notification_time}</code> <code>{timezone_display}</code>\n"
-        f"📅 Created: <code>{created_utc}</code>\n"
-        f"🔄 Last Updated: <code>{last_updated_utc}</code>",
+        _STATUS_TMPL.format(
+            username=user['aspen_username'],
+            notification_time=notification_time,
+            timezone=timezone_display,
+            created=created_utc,
+            last_updated=last_updated_utc
+        ),
         parse_mode='HTML'
     )
 
@@ -716,52 +999,16 @@ async def donate(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show donation information."""
     if config.DONATION_URL:
         await update.message.reply_text(
-            "💝 <b>Support the Developer</b>\n\n"
-            "If you find this bot helpful, consider supporting its development!\n\n"
-            "Your support helps with:\n"
-            "• Server hosting costs\n"
-            "• Development time\n"
-            "• New features and improvements\n"
-            "• Bug fixes and maintenance\n\n"
-            f"🙏 <a href='{config.DONATION_URL}'>Click here to donate</a>\n\n"
-            "Thank you for your support! 💙",
+            _DONATE_TEXT,
             parse_mode='HTML',
             disable_web_page_preview=True
         )
     else:
-        await update.message.reply_text(
-            "💝 <b>Support the Developer</b>\n\n"
-            "Thank you for using this bot! Your support is greatly appreciated. 💙",
-            parse_mode='HTML'
-        )
+        await update.message.reply_text(_DONATE_THANKS_TEXT, parse_mode='HTML')
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show help information."""
-    await update.message.reply_text(
-        "❓ <b>Help & Instructions</b>\n\n"
-        "<b>Available Commands:</b>\n"
-        "🔐 /register - Set up your Aspen account\n"
-        "📊 /grades - Check your current grades\n"
-        "⚙️ /settings - Manage your account\n"
-        "📊 /status - Check your account status\n"
-        "💝 /donate - Support the developer\n"
-        "💬 /feedback - Send feedback or report issues\n"
-        "❓ /help - Show this help message\n\n"
-        "<b>Getting Started:</b>\n"
-        "1. Use /register to set up your Aspen credentials\n"
-        "2. Use /grades to check your grades anytime\n"
-        "3. You'll receive daily grade updates via Telegram\n\n"
-        "⏰ <b>Notification Timing:</b>\n"
-        "• Notifications may be delayed by 1-2 minutes\n"
-        "• This prevents server overload and ensures reliability\n\n"
-        "🔒 <b>Security & Privacy:</b>\n"
-        "• Your credentials are encrypted and secure\n"
-        "• Data is never shared with third parties\n"
-        "• You can delete your account anytime\n\n"
-        "<b>Need Help?</b>\n"
-        "If you have issues, make sure your Aspen credentials are correct and try /register again.",
-        parse_mode='HTML'
-    )
+    await update.message.reply_text(_HELP_TEXT, parse_mode='HTML')
 
 # Admin Commands
 @admin_required
@@ -769,20 +1016,7 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Admin command with subcommands."""
     if not context.args:
         # Show admin menu
-        await update.message.reply_text(
-            "🛠️ <b>Admin Panel</b>\n\n"
-            "<b>Available Commands:</b>\n"
-            "📊 /admin stats - Show user statistics\n"
-            "👥 /admin users - Show user details\n"
-            "📢 /admin broadcast [message] - Send announcement\n"
-            "💬 /admin feedback - Show recent feedback messages\n\n"
-            "<b>Examples:</b>\n"
-            "• /admin stats\n"
-            "• /admin users\n"
-            "• /admin broadcast Hello everyone!\n"
-            "• /admin feedback",
-            parse_mode='HTML'
-        )
+        await update.message.reply_text(_ADMIN_MENU_TEXT, parse_mode='HTML')
         return
 
     subcommand = context.args[0].lower()
@@ -796,69 +1030,41 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif subcommand == "feedback":
         await _admin_feedback(update, context)
     else:
-        await update.message.reply_text(
-            "❌ <b>Invalid subcommand</b>\n\n"
-            "Available: stats, users, broadcast, feedback\n"
-            "Example: /admin stats",
-            parse_mode='HTML'
-        )
+        await update.message.reply_text(_ADMIN_INVALID_TEXT, parse_mode='HTML')
 
 async def _admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show admin statistics."""
     try:
-        # Get all users
-        all_users = db.get_all_active_users()
+        # Get all users with their settings, and the notification hour buckets, concurrently
+        all_users, notification_hours = await asyncio.gather(
+            asyncio.to_thread(db.get_all_users_with_settings),
+            asyncio.to_thread(db.get_notification_hour_counts)
+        )
         total_users = len(all_users)
 
-        # Get user settings for analysis
-        notification_times = {}
-        timezones = {}
-
-        for user in all_users:
-            settings = db.get_user_settings(user['telegram_id'])
-            if settings:
-                # Notification time distribution
-                time = settings.get('notification_time', '15:00')
-                hour = int(time.split(':')[0])
-                time_slot = f"{hour:02d}:00-{hour:02d}:59"
-                notification_times[time_slot] = notification_times.get(time_slot, 0) + 1
-
-                # Timezone distribution
-                tz = settings.get('timezone', 'America/Chicago')
-                timezones[tz] = timezones.get(tz, 0) + 1
+        # Timezone distribution
+        timezones = Counter(user['timezone'] for user in all_users)
 
         # Create notification time chart
-        time_chart = "📊 <b>Notification Time Distribution:</b>\n"
-        for time_slot in sorted(notification_times.keys()):
-            count = notification_times[time_slot]
-            bar = "█" * min(count, 20)  # Max 20 bars
-            time_chart += f"{time_slot}: {bar} ({count})\n"
+        time_chart = "📊 <b>Notification Time Distribution:</b>\n" + "".join(
+            f"{hour:02d}:00-{hour:02d}:59: {'█' * min(count, 20)} ({count})\n"  # Max 20 bars
+            for hour, count in sorted(notification_hours.items())
+        )
 
         # Create timezone chart
-        tz_chart = "🌍 <b>Timezone Distribution:</b>\n"
-        for tz in sorted(timezones.keys()):
-            count = timezones[tz]
-            tz_display = tz.replace('America/', '').replace('Pacific/', '')
-            tz_chart += f"{tz_display}: {count} users\n"
-
-        # Recent registrations (last 7 days)
-        from datetime import datetime, timedelta
-        recent_cutoff = datetime.now() - timedelta(days=7)
-        recent_users = 0
-
-        for user in all_users:
-            if user.get('created_at'):
-                try:
-                    created = datetime.fromisoformat(user['created_at'])
-                    if created > recent_cutoff:
-                        recent_users += 1
-                except:
-                    pass
-
-        message = f"📈 <b>Admin Statistics</b>\n\n"
-        message += f"👥 <b>Total Users:</b> {total_users}\n"
-        message += f"🆕 <b>New Users (7 days):</b> {recent_users}\n\n"
-        message += time_chart + "\n" + tz_chart
+        tz_chart = "🌍 <b>Timezone Distribution:</b>\n" + "".join(
+            f"{tz.replace('America/', '').replace('Pacific/', '')}: {count} users\n"
+            for tz, count in sorted(timezones.items())
+        )
+
+        # Recent registrations (last 7 days). created_at is stored as UTC 'YYYY-MM-DD HH:MM:SS[.ffffff]',
+        # which sorts lexicographically, so compare strings instead of parsing each one
+        recent_cutoff = (datetime.utcnow() - timedelta(days=7)).isoformat(' ')
+        recent_users = sum(1 for user in all_users if str(user.get('created_at') or '') > recent_cutoff)
+
+        message = _ADMIN_STATS_TMPL.format(
+            total_users=total_users, recent_users=recent_users, time_chart=time_chart, tz_chart=tz_chart
+        )
 
         await update.message.reply_text(message, parse_mode='HTML')
 
@@ -871,72 +1077,34 @@ async def _admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def _admin_users(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show detailed user information."""
     try:
-        all_users = db.get_all_active_users()
+        # Only the first page of users is shown, so let the DB do the slicing
+        users, total_users = await asyncio.to_thread(db.get_active_users_page, limit=10)
 
-        if not all_users:
+        if not users:
             await update.message.reply_text("📭 No users found.")
             return
 
         # Show first 10 users with details
-        message = f"👥 <b>User Details</b> (showing first 10 of {len(all_users)})\n\n"
+        parts = [f"👥 <b>User Details</b> (showing first 10 of {total_users})\n\n"]
 
-        for i, user in enumerate(all_users[:10]):
-            settings = db.get_user_settings(user['telegram_id'])
-            timezone = settings.get('timezone', 'America/Chicago') if settings else 'America/Chicago'
-            notification_time = settings.get('notification_time', '15:00') if settings else '15:00'
+        for i, user in enumerate(users):
+            timezone = user['timezone']
+            notification_time = user['notification_time']
 
-            # Format created timestamp with timezone
-            try:
-                from datetime import datetime
-                import pytz
-
-                created_at = user.get('created_at', 'Unknown')
-                if created_at != 'Unknown' and created_at is not None:
-                    # Handle different timestamp formats
-                    if isinstance(created_at, int):
-                        # Handle integer timestamps (like 1)
-                        if created_at == 1:
-                            created_formatted = 'Recently registered'
-                        else:
-                            # Try to convert from timestamp
-                            created_dt = datetime.fromtimestamp(created_at)
-                            user_tz = pytz.timezone(timezone)
-                            created_dt = user_tz.localize(created_dt)
-                            created_formatted = created_dt.strftime('%Y-%m-%d %H:%M:%S %Z')
-                    elif isinstance(created_at, str):
-                        # Handle string timestamps
-                        if created_at == '1' or created_at == '':
-                            created_formatted = 'Recently registered'
-                        else:
-                            created_dt = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                            user_tz = pytz.timezone(timezone)
-                            if created_dt.tzinfo is None:
-                                created_dt = pytz.UTC.localize(created_dt)
-                            created_local = created_dt.astimezone(user_tz)
-                            created_formatted = created_local.strftime('%Y-%m-%d %H:%M:%S %Z')
-                    else:
-                        # Handle datetime objects
-                        created_dt = created_at
-                        user_tz = pytz.timezone(timezone)
-                        if created_dt.tzinfo is None:
-                            created_dt = pytz.UTC.localize(created_dt)
-                        created_local = created_dt.astimezone(user_tz)
-                        created_formatted = created_local.strftime('%Y-%m-%d %H:%M:%S %Z')
-                else:
-                    created_formatted = 'Unknown'
-            except Exception as e:
-                logger.error(f"Error formatting timestamp for user {user['telegram_id']}: {e}")
-                created_formatted = f"Invalid timestamp: {user.get('created_at', 'Unknown')}"
+            created_formatted = _fmt_created(user.get('created_at'), timezone, user['telegram_id'])
 
-            message += f"<b>User {i+1}:</b>\n"
-            message += f"• ID: {user['telegram_id']}\n"
-            message += f"• Username: {user['aspen_username']}\n"
-            message += f"• Timezone: {timezone}\n"
-            message += f"• Notification: {notification_time}\n"
-            message += f"• Created: {created_formatted}\n\n"
+            parts.append(
+                f"<b>User {i+1}:</b>\n"
+                f"• ID: {user['telegram_id']}\n"
+                f"• Username: {user['aspen_username']}\n"
+                f"• Timezone: {timezone}\n"
+                f"• Notification: {notification_time}\n"
+                f"• Created: {created_formatted}\n\n"
+            )
 
-        if len(all_users) > 10:
-            message += f"... and {len(all_users) - 10} more users"
+        if total_users > 10:
+            parts.append(f"... and {total_users - 10} more users")
+        message = "".join(parts)
 
         await update.message.reply_text(message, parse_mode='HTML')
 
@@ -950,32 +1118,30 @@ async def _admin_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Send broadcast message to all users."""
     # Get message from args (skip the 'broadcast' subcommand)
     if len(context.args) < 2:
-        await update.message.reply_text(
-            "📢 <b>Broadcast Message</b>\n\n"
-            "Usage: /admin broadcast <message>\n\n"
-            "Example: /admin broadcast Hello everyone! The bot will be updated tonight.",
-            parse_mode='HTML'
-        )
+        await update.message.reply_text(_BROADCAST_USAGE_TEXT, parse_mode='HTML')
         return
 
     message_text = " ".join(context.args[1:])  # Skip 'broadcast' subcommand
 
     try:
-        all_users = db.get_all_active_users()
-        sent_count = 0
-        failed_count = 0
+        all_users = await asyncio.to_thread(db.get_all_active_users)
+        chat_ids = [user['telegram_id'] for user in all_users]
+        text = f"📢 <b>Announcement</b>\n\n{message_text}"
 
-        for user in all_users:
-            try:
-                await context.bot.send_message(
-                    chat_id=user['telegram_id'],
-                    text=f"📢 <b>Announcement</b>\n\n{message_text}",
-                    parse_mode='HTML'
-                )
-                sent_count += 1
-            except Exception as e:
-                logger.error(f"Failed to send broadcast to user {user['telegram_id']}: {e}")
-                failed_count += 1
+        if not config.SERVERLESS:
+            # Hand off to the long-lived send worker and answer the admin right away
+            queued_count = _enqueue_sends(context.bot, chat_ids, text, 'broadcast')
+            await update.message.reply_text(
+                f"📢 <b>Broadcast Queued</b>\n\n"
+                f"📬 Queued: {queued_count} messages",
+                parse_mode='HTML'
+            )
+            return
+
+        # Serverless requests don't outlive the update, so send before replying
+        results = await _send_to_many(context.bot, chat_ids, text, 'broadcast')
+        sent_count = sum(results)
+        failed_count = len(results) - sent_count
 
         await update.message.reply_text(
             f"📢 <b>Broadcast Complete</b>\n\n"
@@ -995,39 +1161,33 @@ async def _admin_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show recent feedback messages."""
     try:
         # Get recent feedback (last 10 messages)
-        feedback_list = db.get_feedback(limit=10)
+        feedback_list = await asyncio.to_thread(db.get_feedback, limit=10)
 
         if not feedback_list:
             await update.message.reply_text("📭 No feedback messages found.")
             return
 
-        message = f"💬 <b>Recent Feedback</b> (showing last {len(feedback_list)})\n\n"
+        parts = [f"💬 <b>Recent Feedback</b> (showing last {len(feedback_list)})\n\n"]
 
         for i, feedback in enumerate(feedback_list):
             # Format timestamp
             try:
-                from datetime import datetime
                 created_dt = datetime.fromisoformat(feedback['created_at'].replace('Z', '+00:00'))
                 time_str = created_dt.strftime('%Y-%m-%d %H:%M')
             except:
                 time_str = feedback['created_at']
 
-            # Format feedback type
-            type_emojis = {
-                'bug': '🐛',
-                'feature': '💡',
-                'question': '❓',
-                'general': '💝'
-            }
-            emoji = type_emojis.get(feedback['feedback_type'], '💬')
-
-            message += f"<b>{i+1}. {emoji} {feedback['feedback_type'].title()}</b>\n"
-            message += f"• From: {feedback['first_name']} (@{feedback['username']})\n"
-            message += f"• ID: {feedback['user_id']}\n"
-            message += f"• Time: {time_str}\n"
-            message += f"• Message: {feedback['message'][:100]}{'...' if len(feedback['message']) > 100 else ''}\n\n"
+            emoji = _TYPE_EMOJIS.get(feedback['feedback_type'], _DEFAULT_EMOJI)
 
-        await update.message.reply_text(message, parse_mode='HTML')
+            parts.append(
+                f"<b>{i+1}. {emoji} {feedback['feedback_type'].title()}</b>\n"
+                f"• From: {feedback['first_name']} (@{feedback['username']})\n"
+                f"• ID: {feedback['user_id']}\n"
+                f"• Time: {time_str}\n"
+                f"• Message: {feedback['message'][:100]}{'...' if len(feedback['message']) > 100 else ''}\n\n"
+            )
+
+        await update.message.reply_text("".join(parts), parse_mode='HTML')
 
     except Exception as e:
         logger.error(f"Error in admin_feedback: {str(e)}")
@@ -1037,39 +1197,28 @@ async def _admin_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def _notify_admins_feedback(update: Update, context: ContextTypes.DEFAULT_TYPE, user, feedback_type: str, message: str):
     """Send real-time feedback notification to all admins."""
+    if not _ADMIN_IDS:
+        return
+
     try:
-        # Get feedback type emoji
-        type_emojis = {
-            'bug': '🐛',
-            'feature': '💡',
-            'question': '❓',
-            'general': '💝'
-        }
-        emoji = type_emojis.get(feedback_type, '💬')
+        emoji = _TYPE_EMOJIS.get(feedback_type, _DEFAULT_EMOJI)
 
         # Format admin notification
-        admin_message = f"🔔 <b>New Feedback Received</b>\n\n"
-        admin_message += f"{emoji} <b>Type:</b> {feedback_type.replace('_', ' ').title()}\n"
-        admin_message += f"👤 <b>From:</b> {user.first_name or 'Unknown'}"
-        if user.username:
-            admin_message += f" (@{user.username})"
-        admin_message += f"\n🆔 <b>User ID:</b> {user.id}\n"
-        admin_message += f"💬 <b>Message:</b>\n{message}\n\n"
-        admin_message += f"<i>Use /admin feedback to view all feedback</i>"
+        handle = f" (@{user.username})" if user.username else ""
+        admin_message = (
+            "🔔 <b>New Feedback Received</b>\n\n"
+            f"{emoji} <b>Type:</b> {feedback_type.replace('_', ' ').title()}\n"
+            f"👤 <b>From:</b> {user.first_name or 'Unknown'}{handle}\n"
+            f"🆔 <b>User ID:</b> {user.id}\n"
+            f"💬 <b>Message:</b>\n{message}\n\n"
+            "<i>Use /admin feedback to view all feedback</i>"
+        )
 
         # Send to all admins
-        for admin_id in config.ADMIN_USER_IDS:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=admin_message,
-                    parse_mode='HTML'
-                )
-            except Exception as e:
-                logger.error(f"Failed to send feedback notification to admin {admin_id}: {e}")
+        await _send_to_many(context.bot, _ADMIN_IDS, admin_message, 'feedback notification')
 
     except Exception as e:
-        logger.error(f"Error notifying admins of feedback: {e}")
+        logger.error("Error notifying admins of feedback: %s", e)
 
 # Feedback Commands
 async def feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1078,20 +1227,10 @@ async def feedback(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Check if user has already started feedback
     if 'feedback_text' in context.user_data:
-        await update.message.reply_text(
-            "💬 <b>Feedback Already Started</b>\n\n"
-            "You already have a feedback message in progress. Please send your feedback message now, or use /cancel to start over.",
-            parse_mode='HTML'
-        )
+        await update.message.reply_text(_FEEDBACK_IN_PROGRESS_TEXT, parse_mode='HTML')
         return
 
-    await update.message.reply_text(
-        "💬 <b>Send Feedback</b>\n\n"
-        "We'd love to hear from you! Please type your feedback message below:\n\n"
-        "<i>Be as detailed as possible. Your feedback helps us improve the bot!</i>\n\n"
-        "Use /cancel to cancel.",
-        parse_mode='HTML'
-    )
+    await update.message.reply_text(_FEEDBACK_PROMPT_TEXT, parse_mode='HTML')
 
     # Set a flag to indicate feedback is in progress
     context.user_data['feedback_in_progress'] = True
@@ -1105,208 +1244,181 @@ async def handle_feedback_message(update: Update, context: ContextTypes.DEFAULT_
     logger.info("Feedback message handler called")
 
     feedback_text = update.message.text.strip()
-    logger.info(f"Feedback message: {feedback_text[:100]}...")
-
-    # Get user info
-    user = update.effective_user
-    user_info = {
-        'id': user.id,
-        'username': user.username,
-        'first_name': user.first_name,
-        'last_name': user.last_name
-    }
-
-    logger.info(f"User info: {user_info}")
 
-    # Save feedback to database
-    try:
-        result = db.add_feedback(
-            user_id=user.id,
-            username=user.username or 'Unknown',
-            first_name=user.first_name or 'Unknown',
-            feedback_type='general',  # Default to general feedback
-            message=feedback_text
+    # Reject empty or oversized feedback before touching the DB or admins
+    if not feedback_text:
+        await update.message.reply_text("❌ Empty feedback ignored. Please type your feedback message, or use /cancel.")
+        return
+    if len(feedback_text) > FEEDBACK_MAX_LENGTH:
+        await update.message.reply_text(
+            f"❌ Feedback is too long (max {FEEDBACK_MAX_LENGTH} characters). Please shorten it and send it again."
         )
-        logger.info(f"Database save result: {result}")
-    except Exception as e:
-        logger.error(f"Database save error: {e}")
+        return
 
-    # Send real-time notification to all admins
-    try:
-        await _notify_admins_feedback(update, context, user, 'general', feedback_text)
-        logger.info("Admin notifications sent")
-    except Exception as e:
-        logger.error(f"Admin notification error: {e}")
+    user = update.effective_user
+
+    # Only build the log details when INFO is actually emitted
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Feedback message: %s...", feedback_text[:100])
+        user_info = {
+            'id': user.id,
+            'username': user.username,
+            'first_name': user.first_name,
+            'last_name': user.last_name
+        }
+        logger.info("User info: %s", user_info)
+
+    save = asyncio.to_thread(
+        db.add_feedback,
+        user_id=user.id,
+        username=user.username or 'Unknown',
+        first_name=user.first_name or 'Unknown',
+        feedback_type='general',  # Default to general feedback
+        message=feedback_text
+    )
+    notify = _notify_admins_feedback(update, context, user, 'general', feedback_text)
+
+    if config.SERVERLESS:
+        # Serverless requests don't outlive the update, so finish both before replying
+        results = await asyncio.gather(save, notify, return_exceptions=True)
+        for label, result in zip(("Database save", "Admin notification"), results):
+            if isinstance(result, BaseException):
+                logger.error("%s error: %s", label, result)
+    else:
+        # Save feedback and notify admins in the background so the user's confirmation isn't held up
+        _spawn(save, "Database save")
+        _spawn(notify, "Admin notification")
 
     # Send confirmation to user
     try:
-        await update.message.reply_text(
-            "✅ <b>Thank you for your feedback!</b>\n\n"
-            "Your feedback has been received and will be reviewed.\n\n"
-            "We appreciate you taking the time to help us improve the bot! 💙",
-            parse_mode='HTML'
-        )
+        await update.message.reply_text(_FEEDBACK_THANKS_TEXT, parse_mode='HTML')
         logger.info("User confirmation sent")
     except Exception as e:
-        logger.error(f"User confirmation error: {e}")
+        logger.error("User confirmation error: %s", e)
 
     # Clear user data
     context.user_data.clear()
 
 
 # Callback query handlers
-async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle button callbacks."""
-    query = update.callback_query
-    await query.answer()
-
-    # Handle feedback callbacks
-    if query.data.startswith("feedback_"):
-        logger.info(f"Handling feedback callback: {query.data}")
-        return await handle_feedback_type(update, context)
+async def _handle_update_creds(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.callback_query.edit_message_text(_UPDATE_CREDS_PROMPT_TEXT, parse_mode='HTML')
+    context.user_data['updating'] = _UpdateKind.CREDENTIALS
+    return SET_CREDENTIALS_USERNAME
+
+async def _handle_set_notification_time(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.callback_query.edit_message_text(_SET_TIME_PROMPT_TEXT, parse_mode='HTML')
+    return SET_NOTIFICATION_TIME
+
+async def _handle_set_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.callback_query.edit_message_text(
+        _SELECT_TIMEZONE_TEXT,
+        parse_mode='HTML',
+        reply_markup=_SETTINGS_TIMEZONE_KEYBOARD
+    )
+    return SET_TIMEZONE
 
-    if query.data == "update_creds":
-        await query.edit_message_text(
-            "🔐 <b>Update Credentials</b>\n\n"
-            "Please send your new Aspen username:",
-            parse_mode='HTML'
-        )
-        context.user_data['updating'] = 'credentials'
-        return SET_CREDENTIALS_USERNAME
+async def _handle_timezone_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    timezone = query.data.replace("timezone_", "")
 
-    # Removed email-related options - Telegram only
+    success = await asyncio.to_thread(db.update_user_timezone, query.from_user.id, timezone, TIMEZONE_TO_DISPLAY.get(timezone))
+    _invalidate_user_ctx(context)
+    chat_id = update.effective_chat.id if update.effective_chat else query.from_user.id
 
-    elif query.data == "set_notification_time":
-        await query.edit_message_text(
-            "⏰ <b>Set Notification Time</b>\n\n"
-            "Please send the time when you want to receive daily grade notifications.\n\n"
-            "<b>Format examples:</b>\n"
-            "• <code>15:00</code> (3:00 PM)\n"
-            "• <code>08:30</code> (8:30 AM)\n"
-            "• <code>22:00</code> (10:00 PM)\n\n"
-            "Send the time in 24-hour format (HH:MM):",
-            parse_mode='HTML'
-        )
-        return SET_NOTIFICATION_TIME
+    if success:
+        timezone_display = TIMEZONE_TO_DISPLAY.get(timezone, "Unknown")
 
-    elif query.data == "set_timezone":
-        # Create timezone selection keyboard
-        keyboard = []
-        for display_name, timezone in COMMON_TIMEZONES.items():
-            keyboard.append([InlineKeyboardButton(display_name, callback_data=f"timezone_{timezone}")])
+        confirmation_text = _TIMEZONE_UPDATED_TMPL.format(timezone=timezone_display)
 
-        keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data="cancel_timezone")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        try:
+            await query.edit_message_text(
+                "✅ Timezone updated! Sending confirmation…",
+                parse_mode='HTML'
+            )
+        except TelegramError as e:
+            logger.warning(f"Failed to edit timezone confirmation message for user {query.from_user.id}: {e}")
 
-        await query.edit_message_text(
-            "🌍 <b>Select Your Timezone</b>\n\n"
-            "Choose your timezone for grade notifications:\n\n"
-            "<i>This ensures notifications arrive at the correct local time.</i>",
-            parse_mode='HTML',
-            reply_markup=reply_markup
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=confirmation_text,
+            parse_mode='HTML'
         )
-        return SET_TIMEZONE
-
-    elif query.data.startswith("timezone_"):
-        timezone = query.data.replace("timezone_", "")
-
-        success = db.update_user_timezone(query.from_user.id, timezone)
-        chat_id = update.effective_chat.id if update.effective_chat else query.from_user.id
-
-        if success:
-            timezone_display = "Unknown"
-            for display, tz in COMMON_TIMEZONES.items():
-                if tz == timezone:
-                    timezone_display = display
-                    break
+    else:
+        error_text = "❌ Failed to update timezone. Please try again with /settings."
+        try:
+            await query.edit_message_text(error_text)
+        except TelegramError as e:
+            logger.warning(f"Failed to edit timezone failure message for user {query.from_user.id}: {e}")
 
-            confirmation_text = (
-                "✅ <b>Timezone Updated!</b>\n\n"
-                f"Your timezone has been set to <b>{timezone_display}</b>.\n\n"
-                "Grade notifications will now be sent according to your local time.\n\n"
-                "Use /settings to change this anytime."
-            )
+        await context.bot.send_message(chat_id=chat_id, text=error_text)
+    return ConversationHandler.END
 
-            try:
-                await query.edit_message_text(
-                    "✅ Timezone updated! Sending confirmation…",
-                    parse_mode='HTML'
-                )
-            except TelegramError as e:
-                logger.warning(f"Failed to edit timezone confirmation message for user {query.from_user.id}: {e}")
+async def _handle_cancel_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.callback_query.edit_message_text(_TIMEZONE_CANCELLED_TEXT)
+    return ConversationHandler.END
 
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=confirmation_text,
-                parse_mode='HTML'
-            )
-        else:
-            error_text = "❌ Failed to update timezone. Please try again with /settings."
-            try:
-                await query.edit_message_text(error_text)
-            except TelegramError as e:
-                logger.warning(f"Failed to edit timezone failure message for user {query.from_user.id}: {e}")
+async def _handle_setup_complete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await complete_setup(update, context)
+    return ConversationHandler.END
 
-            await context.bot.send_message(chat_id=chat_id, text=error_text)
-        return ConversationHandler.END
+async def _handle_delete_account(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.callback_query.edit_message_text(
+        _DELETE_CONFIRM_TEXT,
+        parse_mode='HTML',
+        reply_markup=_DELETE_CONFIRM_KEYBOARD
+    )
+    return SETTINGS_MENU
 
-    elif query.data == "cancel_timezone":
+async def _handle_confirm_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    query = update.callback_query
+    success = await asyncio.to_thread(db.delete_user, update.effective_user.id)
+    context.user_data.clear()
+    _invalidate_user_ctx(context)
+    _scraper_cache.pop(update.effective_user.id, None)
+    if success:
+        await query.edit_message_text(_ACCOUNT_DELETED_TEXT, parse_mode='HTML')
+    else:
         await query.edit_message_text(
-            "❌ Timezone selection cancelled.\n\n"
-            "Use /settings to try again."
+            "❌ Failed to delete account. Please try again."
         )
-        return ConversationHandler.END
+    return ConversationHandler.END
+
+async def _handle_cancel_delete(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+    await update.callback_query.edit_message_text(_DELETE_CANCELLED_TEXT)
+    return ConversationHandler.END
 
+# Exact callback_data values and the handler for each
+_CALLBACK_HANDLERS = {
+    "update_creds": _handle_update_creds,
+    "set_notification_time": _handle_set_notification_time,
+    "set_timezone": _handle_set_timezone,
+    "cancel_timezone": _handle_cancel_timezone,
     # Setup flow handlers
-    elif query.data in ["setup_timezone", "setup_notification_time", "setup_complete"]:
-        if query.data == "setup_timezone":
-            return await setup_timezone_selection(update, context)
-        elif query.data == "setup_notification_time":
-            return await setup_notification_time_selection(update, context)
-        elif query.data == "setup_complete":
-            await complete_setup(update, context)
-            return ConversationHandler.END
-
-    elif query.data == "delete_account":
-        keyboard = [
-            [InlineKeyboardButton("✅ Yes, Delete", callback_data="confirm_delete")],
-            [InlineKeyboardButton("❌ Cancel", callback_data="cancel_delete")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+    "setup_timezone": setup_timezone_selection,
+    "setup_notification_time": setup_notification_time_selection,
+    "setup_complete": _handle_setup_complete,
+    "delete_account": _handle_delete_account,
+    "confirm_delete": _handle_confirm_delete,
+    "cancel_delete": _handle_cancel_delete,
+}
 
-        await query.edit_message_text(
-            "🗑️ <b>Delete Account</b>\n\n"
-            "⚠️ This will permanently delete your account and all data.\n"
-            "Are you sure you want to continue?",
-            parse_mode='HTML',
-            reply_markup=reply_markup
-        )
-        return SETTINGS_MENU
+async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle button callbacks."""
+    query = update.callback_query
+    await query.answer()
 
-    elif query.data == "confirm_delete":
-        success = db.delete_user(update.effective_user.id)
-        context.user_data.clear()
-        if success:
-            await query.edit_message_text(
-                "🗑️ <b>Account Deleted</b>\n\n"
-                "Your account has been permanently deleted.\n"
-                "Use /register to create a new account.",
-                parse_mode='HTML'
-            )
-        else:
-            await query.edit_message_text(
-                "❌ Failed to delete account. Please try again."
-            )
-        return ConversationHandler.END
+    handler = _CALLBACK_HANDLERS.get(query.data)
+    if handler:
+        return await handler(update, context)
 
-    elif query.data == "cancel_delete":
-        await query.edit_message_text(
-            "✅ Account deletion cancelled.\n\n"
-            "Your account remains active."
-        )
-        return ConversationHandler.END
+    # Handle feedback callbacks
+    if query.data.startswith("feedback_"):
+        logger.info(f"Handling feedback callback: {query.data}")
+        return await handle_feedback_type(update, context)
 
-    # Removed notification method handling - Telegram only
+    if query.data.startswith("timezone_"):
+        return await _handle_timezone_choice(update, context)
 
 # Conversation handlers
 registration_handler = ConversationHandler(
@@ -1319,7 +1431,7 @@ registration_handler = ConversationHandler(
     allow_reentry=True
 )
 
-_settings_callback_pattern = (
+_settings_callback_pattern = re.compile(
     r"^(update_creds|set_notification_time|set_timezone|delete_account|"
     r"confirm_delete|cancel_delete|timezone_.+|cancel_timezone)$"
 )
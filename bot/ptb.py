@@ -3,7 +3,7 @@ from fastapi import FastAPI
 import config
 from telegram.ext import Application, JobQueue
 from typing import AsyncGenerator
-from bot.handlers import setup_commands
+from bot.handlers import drain_send_queue, setup_commands
 
 # https://github.com/python-telegram-bot/python-telegram-bot/wiki/Handling-network-errors
 ptb = (
@@ -12,6 +12,7 @@ ptb = (
     .read_timeout(7)
     .get_updates_read_timeout(42)
     .job_queue(JobQueue())  # Create a new JobQueue instance
+    .post_stop(drain_send_queue)  # Flush queued broadcasts when run_polling stops
 )
 if config.ENV:
     ptb = ptb.updater(None)
@@ -29,4 +30,6 @@ async def lifespan(_: FastAPI) -> AsyncGenerator:
     async with ptb:
         await ptb.start()
         yield
+        # post_stop only runs under run_polling/run_webhook, so drain here for the webhook app
+        await drain_send_queue(ptb)
         await ptb.stop()
@@ -3,105 +3,214 @@ from bot.scraper import AspenScraper
 # Email service removed - Telegram only notifications
 from database import Database
 import logging
-from datetime import time, datetime, timedelta
-import pytz
+from datetime import time, datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
 import asyncio
-import random
-import config
 
 logger = logging.getLogger(__name__)
 
 # Initialize database
 db = Database()
 
-# Rate limiting and request spacing
-REQUEST_DELAY_MIN = 30  # Minimum 30 seconds between requests
-REQUEST_DELAY_MAX = 60  # Maximum 1 minutes between requests
+# Rate limiting
 MAX_CONCURRENT_REQUESTS = 3  # Maximum concurrent requests to Aspen
 
-# Global request queue and semaphore
-request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
-last_request_time = 0
+# Days jobs run on, Monday-Friday in the user's timezone (PTB numbering: 0 = Sunday)
+SCHOOL_DAYS = (1, 2, 3, 4, 5)
+
+# Longest message we build when joining report parts, below Telegram's 4096 limit
+MESSAGE_COALESCE_LIMIT = 4000
+
+@lru_cache(maxsize=128)
+def _tz(name: str) -> ZoneInfo:
+    """Return a cached ZoneInfo for an IANA timezone name."""
+    return ZoneInfo(name)
+
+def coalesce_messages(messages: list, limit: int = MESSAGE_COALESCE_LIMIT) -> list:
+    """Join consecutive report parts into as few messages as fit under the length limit."""
+    coalesced = []
+    buf = ""
+    for message in messages:
+        if buf and len(buf) + len(message) + 1 > limit:
+            coalesced.append(buf)
+            buf = message
+        else:
+            buf = f"{buf}\n{message}" if buf else message
+    if buf:
+        coalesced.append(buf)
+    return coalesced
+
+def job_days(scheduled_datetime: datetime, scheduled_utc: datetime) -> tuple:
+    """Map the user's local school days onto the UTC days the daily job must run on."""
+    shift = (scheduled_utc.date() - scheduled_datetime.date()).days
+    return tuple(sorted((day + shift) % 7 for day in SCHOOL_DAYS))
+
+def job_offset_seconds(telegram_id: int) -> int:
+    """Return a stable 0-59 second offset that spreads users sharing a notification time."""
+    return telegram_id % 60
+
+class AdmissionController:
+    """Concurrency limit for Aspen requests that, unlike a semaphore, can be resized while in use."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        """Wait until fewer than `limit` requests are running, then take a slot."""
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def release(self):
+        """Free a slot and wake one waiting request."""
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify(1)
+
+    async def resize(self, limit: int):
+        """Change the limit; requests already running finish, new ones wait for a free slot."""
+        async with self._cond:
+            self.limit = limit
+            self._cond.notify_all()
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.release()
+
+# Global request admission; shrinks when Aspen rate-limits us and recovers on success
+request_controller = AdmissionController(MAX_CONCURRENT_REQUESTS)
 
 async def fetch_and_notify_user(context: ContextTypes.DEFAULT_TYPE):
     """Fetch grades and notify a specific user with rate limiting"""
-    async with request_semaphore:
-        try:
-            user_data = context.job.data
-            user_id = user_data['telegram_id']
-
-            # Always read fresh credentials from database (not cached job data)
-            fresh_user = db.get_user(user_id)
-            if not fresh_user:
-                logger.warning(f"User {user_id} not found in database, skipping notification")
-                return
-            username = fresh_user['aspen_username']
-            password = fresh_user['aspen_password']
-
-            # Log the actual execution time
-            current_time = datetime.now()
-            logger.info(f"=== NOTIFICATION EXECUTION ===")
-            logger.info(f"User {user_id} - Job executed at: {current_time.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-            logger.info(f"User {user_id} - Job name: {context.job.name}")
-            logger.info(f"User {user_id} - Job scheduled time: {getattr(context.job, 'scheduled_time', 'Unknown')}")
-
-            # Check if it's a weekend (Saturday = 5, Sunday = 6)
-            if current_time.weekday() >= 5:  # Saturday or Sunday
-                logger.info(f"Skipping notification for user {user_id} - weekend detected (day {current_time.weekday()})")
-                return
-
-            logger.info(f"Processing scheduled grade check for user {user_id} ({username})")
-
-            # Add random delay to prevent simultaneous requests
-            delay = random.uniform(REQUEST_DELAY_MIN, REQUEST_DELAY_MAX)
-            logger.info(f"Waiting {delay:.1f} seconds before request to avoid rate limiting")
-            await asyncio.sleep(delay)
-
+    try:
+        user_data = context.job.data
+        user_id = user_data['telegram_id']
+
+        # Always read fresh credentials and settings from database (not cached job data)
+        fresh_user = await asyncio.to_thread(db.get_user_with_settings, user_id)
+        if not fresh_user:
+            logger.warning(f"User {user_id} not found in database, skipping notification")
+            return
+        username = fresh_user['aspen_username']
+        password = fresh_user['aspen_password']
+
+        # Read the clock once, in the user's timezone; it serves the logs and the report title
+        user_timezone = fresh_user['timezone']
+        current_time = datetime.now(_tz(user_timezone))
+        formatted_time = current_time.strftime('%A, %B %d, %Y at %I:%M %p %Z')
+
+        # Log the actual execution time
+        logger.info(f"=== NOTIFICATION EXECUTION ===")
+        logger.info(f"User {user_id} - Job executed at: {current_time.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+        logger.info(f"User {user_id} - Job name: {context.job.name}")
+        logger.info(f"User {user_id} - Job scheduled time: {getattr(context.job, 'scheduled_time', 'Unknown')}")
+
+        logger.info(f"Processing scheduled grade check for user {user_id} ({username})")
+
+        async with request_controller:
             # Initialize scraper with user's credentials
             scraper = AspenScraper(username, password)
 
-            # Calculate actual notification time vs scheduled time
-            current_time = datetime.now()
-            scheduled_time = context.job.scheduled_time if hasattr(context.job, 'scheduled_time') else current_time
-
-            # Add delay information to title
-            delay_minutes = int((current_time - scheduled_time).total_seconds() / 60) if current_time > scheduled_time else 0
-
-            # Get user's timezone and format time in their local timezone
-            settings = db.get_user_settings(user_id)
-            user_timezone = settings.get('timezone', 'America/Chicago') if settings else 'America/Chicago'
-            user_tz = pytz.timezone(user_timezone)
-
-            # Convert current time to user's timezone
-            user_local_time = current_time.astimezone(user_tz)
-            formatted_time = user_local_time.strftime('%A, %B %d, %Y at %I:%M %p %Z')
-
-            messages = scraper.fetch_formatted_grades(
+            # Scrape in a worker thread so other jobs and updates keep running
+            messages = await asyncio.to_thread(
+                scraper.fetch_formatted_grades,
                 title=f"📚 Daily Grade Update ({formatted_time})"
             )
 
-            # Send notifications via Telegram
-            for message in messages:
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=message,
-                    parse_mode='HTML'
-                )
+            # Back off one slot when Aspen answers 429, otherwise recover towards the maximum
+            if scraper.rate_limited:
+                new_limit = max(1, request_controller.limit - 1)
+                logger.warning(f"Aspen rate limited user {user_id}; lowering concurrent requests to {new_limit}")
+                await request_controller.resize(new_limit)
+            elif request_controller.limit < MAX_CONCURRENT_REQUESTS:
+                await request_controller.resize(request_controller.limit + 1)
 
-            # Send delay explanation if there was a delay
-            if delay_minutes > 0:
+            # Send notifications via Telegram, packing parts into as few requests as possible
+            for message in coalesce_messages(messages):
                 await context.bot.send_message(
                     chat_id=user_id,
-                    text=f"⏰ <b>Delay Notice</b>\n\n"
-                         f"Your notification was delayed by {delay_minutes} minutes due to rate limiting protection.\n\n"
-                         f"This ensures reliable service for all users by preventing server overload.",
+                    text=message,
                     parse_mode='HTML'
                 )
 
-            logger.info(f"Sent scheduled update to user {user_id}")
+        logger.info(f"Sent scheduled update to user {user_id}")
 
-        except Exception as e:
-            logger.error(f"Error in scheduled grade fetch for user {user_data.get('telegram_id', 'unknown')}: {str(e)}", exc_info=True)
+    except Exception as e:
+        logger.error(f"Error in scheduled grade fetch for user {user_data.get('telegram_id', 'unknown')}: {str(e)}", exc_info=True)
+
+def schedule_user_job(job_queue, user: dict):
+    """Schedule (or replace) the daily grade check job for one user.
+
+    ``user`` is a row from db.get_user_with_settings / iter_all_users_with_settings.
+    """
+    notification_time = user['notification_time']
+    user_timezone = user['timezone']
+
+    # Use user's timezone instead of global timezone
+    user_tz = _tz(user_timezone)
+
+    # Stored as seconds since midnight, so no 'HH:MM' parsing is needed
+    hour, minute = divmod(user['notification_seconds'] // 60, 60)
+    logger.debug("User %s - Original notification time: %s", user['telegram_id'], notification_time)
+
+    # Offset by a few seconds to prevent all users hitting at exact same time.
+    # Derived from the user ID so it stays the same across restarts
+    offset_seconds = job_offset_seconds(user['telegram_id'])
+    logger.debug("User %s - Offset: %d seconds", user['telegram_id'], offset_seconds)
+
+    # Create individual job for this user
+    job_name = f"grade_check_user_{user['telegram_id']}"
+
+    # Calculate next run time in user's timezone, then convert to UTC
+    now = datetime.now(user_tz)
+    logger.debug("User %s - Current time in user timezone: %s", user['telegram_id'], now)
+
+    scheduled_datetime = now.replace(hour=hour, minute=minute, second=offset_seconds, microsecond=0)
+    logger.debug("User %s - Scheduled datetime in user timezone: %s", user['telegram_id'], scheduled_datetime)
+
+    # If the scheduled time has already passed today, schedule for tomorrow
+    if scheduled_datetime <= now:
+        scheduled_datetime += timedelta(days=1)
+        logger.debug("User %s - Time has passed today, scheduling for tomorrow: %s", user['telegram_id'], scheduled_datetime)
+
+    # No notifications on weekends, so the first run is the next weekday
+    while scheduled_datetime.weekday() >= 5:
+        scheduled_datetime += timedelta(days=1)
+
+    # Convert to UTC for the scheduler (Telegram Bot expects UTC times)
+    scheduled_utc = scheduled_datetime.astimezone(timezone.utc)
+    logger.debug("User %s - Converted to UTC: %s", user['telegram_id'], scheduled_utc)
+
+    # Create timezone-naive time object in UTC for the scheduler
+    job_time_utc = time(hour=scheduled_utc.hour, minute=scheduled_utc.minute, second=scheduled_utc.second)
+    logger.debug("User %s - Job time UTC (timezone-naive): %s", user['telegram_id'], job_time_utc)
+
+    # The job runs on UTC days, which differ from the local ones when the conversion crosses midnight
+    days = job_days(scheduled_datetime, scheduled_utc)
+
+    # Schedule the job to start at the calculated time
+    job_queue.run_daily(
+        fetch_and_notify_user,
+        time=job_time_utc,
+        days=days,
+        name=job_name,
+        data=user,  # Pass user data to the job
+        # Use the job name as ID so reschedules replace it in place
+        job_kwargs={'id': job_name, 'replace_existing': True, 'next_run_time': scheduled_utc}
+    )
+
+    # One summary line per user; the steps above are only logged at DEBUG
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "User %s - Scheduled: %s %s -> %s UTC (next_run_time: %s)",
+            user['telegram_id'], notification_time, user_timezone, job_time_utc, scheduled_utc.isoformat()
+        )
 
 def setup_scheduler(app: Application):
     """Setup the job queue with individual user grade checking jobs"""
@@ -112,69 +221,28 @@ def setup_scheduler(app: Application):
     except Exception as e:
         logger.warning(f"Could not clear existing jobs: {e}")
 
-    # Get timezone
-    tz = pytz.timezone(config.TIMEZONE)
-
-    # Get all active users and their notification times
-    users = db.get_all_active_users()
-    logger.info(f"Setting up scheduled jobs for {len(users)} users")
-
-    for user in users:
-        try:
-            # Get user settings
-            settings = db.get_user_settings(user['telegram_id'])
-            notification_time = settings.get('notification_time', '15:00') if settings else '15:00'
-            user_timezone = settings.get('timezone', 'America/Chicago') if settings else 'America/Chicago'
-
-            # Use user's timezone instead of global timezone
-            user_tz = pytz.timezone(user_timezone)
-
-            # Parse time (HH:MM format) and add random offset
-            hour, minute = map(int, notification_time.split(':'))
-            logger.info(f"User {user['telegram_id']} - Original notification time: {notification_time} ({hour}:{minute:02d})")
-
-            # Add small random offset to prevent all users hitting at exact same time
-            # Use 0-59 second offset for minimal disruption to user's preferred time
-            random_offset_seconds = random.randint(0, 30)  # 0-30 second offset
-            logger.info(f"User {user['telegram_id']} - Random offset: {random_offset_seconds} seconds")
-
-            # Create individual job for this user
-            job_name = f"grade_check_user_{user['telegram_id']}"
-
-            # Calculate next run time in user's timezone, then convert to UTC
-            now = datetime.now(user_tz)
-            logger.info(f"User {user['telegram_id']} - Current time in user timezone: {now.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-
-            scheduled_datetime = now.replace(hour=hour, minute=minute, second=random_offset_seconds, microsecond=0)
-            logger.info(f"User {user['telegram_id']} - Scheduled datetime in user timezone: {scheduled_datetime.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-
-            # If the scheduled time has already passed today, schedule for tomorrow
-            if scheduled_datetime <= now:
-                scheduled_datetime += timedelta(days=1)
-                logger.info(f"User {user['telegram_id']} - Time has passed today, scheduling for tomorrow: {scheduled_datetime.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-
-            # Convert to UTC for the scheduler (Telegram Bot expects UTC times)
-            scheduled_utc = scheduled_datetime.astimezone(pytz.UTC)
-            logger.info(f"User {user['telegram_id']} - Converted to UTC: {scheduled_utc.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-
-            # Create timezone-naive time object in UTC for the scheduler
-            job_time_utc = time(hour=scheduled_utc.hour, minute=scheduled_utc.minute, second=scheduled_utc.second)
-            logger.info(f"User {user['telegram_id']} - Job time UTC (timezone-naive): {job_time_utc}")
-
-            # Schedule the job to start at the calculated time
-            app.job_queue.run_daily(
-                fetch_and_notify_user,
-                time=job_time_utc,
-                name=job_name,
-                data=user,  # Pass user data to the job
-                job_kwargs={'next_run_time': scheduled_utc}
-            )
+    # Stream all active users with their settings from a single query
+    logger.info("Setting up scheduled jobs for active users")
+    scheduled_count = 0
 
-            logger.info(f"User {user['telegram_id']} - Job scheduled successfully")
-            logger.info(f"User {user['telegram_id']} - Summary: {notification_time} {user_timezone} -> {job_time_utc} UTC (next_run_time: {scheduled_utc.strftime('%Y-%m-%d %H:%M:%S %Z')})")
+    # If the scheduler is already running, pause it so adding N jobs triggers one
+    # wakeup on resume instead of one per job (before start, jobs are queued anyway)
+    scheduler = app.job_queue.scheduler
+    paused = scheduler.running
+    if paused:
+        scheduler.pause()
 
-        except Exception as e:
-            logger.error(f"Error setting up job for user {user['telegram_id']}: {str(e)}")
-            continue
+    try:
+        for user in db.iter_all_users_with_settings():
+            try:
+                schedule_user_job(app.job_queue, user)
+                scheduled_count += 1
+            except Exception as e:
+                logger.error(f"Error setting up job for user {user['telegram_id']}: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error loading users for scheduling: {e}")
+    finally:
+        if paused:
+            scheduler.resume()
 
-    logger.info(f"Completed scheduling {len(users)} individual grade check jobs")
+    logger.info(f"Completed scheduling {scheduled_count} individual grade check jobs")
@@ -1,13 +1,19 @@
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import time
 import json
 import random
 
+# Connection pool shared by every scraper's session. Cookies stay per session,
+# so users are isolated while TCP/TLS connections to Aspen are reused.
+_http_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=10)
+
 
 class AspenScraper:
     def __init__(self, username=None, password=None):
         self.session = requests.Session()
+        self.session.mount("https://", _http_adapter)
         self.base_url = "https://aspen.cps.edu/aspen"
 
         # Rotate user agents to appear more natural
@@ -29,12 +35,20 @@ class AspenScraper:
             'Pragma': 'no-cache'
         }
         self.student_id = None
+        # Set once Aspen answers any request with 429 Too Many Requests
+        self.rate_limited = False
+        self.session.hooks['response'].append(self._check_rate_limit)
         self.username = username
         self.password = password
 
         if not self.username or not self.password:
             raise ValueError("Username and password are required")
 
+    def _check_rate_limit(self, response, *args, **kwargs):
+        """Session response hook that records whether Aspen is rate limiting us"""
+        if response.status_code == 429:
+            self.rate_limited = True
+
     @staticmethod
     def format_score(score_text, percentage=None):
         """Helper function to format score with emoji indicators"""
@@ -150,11 +164,19 @@ class AspenScraper:
         return messages
 
     def fetch_formatted_grades(self, title="📚 Current Grades"):
-        """Fetch grades and return formatted messages"""
-        if not self.login():
+        """Fetch grades and return formatted messages, logging in only if the session isn't authenticated"""
+        reused_session = self.student_id is not None
+        if not reused_session and not self.login():
             return ["❌ Failed to login to Aspen. Please check credentials."]
 
         class_list = self.get_class_list()
+        if not class_list and reused_session:
+            # The reused session may have expired; log in again and retry once
+            self.student_id = None
+            if not self.login():
+                return ["❌ Failed to login to Aspen. Please check credentials."]
+            class_list = self.get_class_list()
+
         if not class_list:
             return ["❌ Failed to fetch classes."]
 
@@ -164,7 +186,11 @@ class AspenScraper:
         # Get CSRF token
         login_page = self.session.get(f"{self.base_url}/logon.do")
         soup = BeautifulSoup(login_page.text, 'html.parser')
-        token = soup.find('input', {'name': 'org.apache.struts.taglib.html.TOKEN'})['value']
+        token_input = soup.find('input', {'name': 'org.apache.struts.taglib.html.TOKEN'})
+        if token_input is None:
+            print("Login failed - No login token on logon page")
+            return False
+        token = token_input['value']
 
         # Login
         login_payload = {
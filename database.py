@@ -1,13 +1,49 @@
 import sqlite3
 import os
+import threading
 import logging
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterator, Tuple
 from cryptography.fernet import Fernet
 import base64
 
 logger = logging.getLogger(__name__)
 
+# Columns that update_user_settings may write
+SETTINGS_COLUMNS = {'timezone', 'notification_frequency', 'notification_time', 'timezone_display'}
+
+# Notification times are stored as seconds since midnight; 15:00 unless the user picks one
+DEFAULT_NOTIFICATION_SECONDS = 15 * 3600
+
+def time_to_seconds(notification_time: str) -> int:
+    """Convert an 'HH:MM' notification time to seconds since midnight."""
+    hour, minute = map(int, notification_time.split(':'))
+    return hour * 3600 + minute * 60
+
+def seconds_to_time(seconds: int) -> str:
+    """Convert seconds since midnight back to the 'HH:MM' form shown to users."""
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}"
+
+# Users joined with their settings, selecting only the columns the user dicts need
+USER_WITH_SETTINGS_QUERY = '''
+    SELECT u.telegram_id, u.aspen_username, u.aspen_password, u.notification_method,
+           u.is_active, u.created_at, u.last_updated,
+           s.timezone, s.notification_time, s.timezone_display
+    FROM users u
+    LEFT JOIN user_settings s USING (telegram_id)
+'''
+
+# Built once so the per-connection statement cache sees identical SQL on every call
+USER_WITH_SETTINGS_BY_ID_QUERY = USER_WITH_SETTINGS_QUERY + 'WHERE u.telegram_id = ?'
+ACTIVE_USERS_WITH_SETTINGS_QUERY = USER_WITH_SETTINGS_QUERY + 'WHERE u.is_active = 1'
+ACTIVE_USERS_PAGE_QUERY = ACTIVE_USERS_WITH_SETTINGS_QUERY + ' ORDER BY u.telegram_id LIMIT ? OFFSET ?'
+
+# Prepared statements kept per connection (sqlite3 defaults to 128)
+STATEMENT_CACHE_SIZE = 256
+
+# Decrypted credentials kept in memory, keyed by ciphertext
+CREDENTIAL_CACHE_SIZE = 1024
+
 class Database:
     def __init__(self, db_path=None):
         """
@@ -27,7 +63,13 @@ class Database:
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
 
         self.db_path = db_path
+        # One persistent connection per thread (handlers reach the DB from worker threads)
+        self._local = threading.local()
         self.encryption_key = self._get_or_create_encryption_key()
+        self._fernet = Fernet(self.encryption_key)
+        # Keyed by ciphertext, so an entry can never outlive the credentials it decrypts,
+        # even when another Database instance rewrites them
+        self._decrypted: Dict[str, str] = {}
         self.init_database()
 
     def _get_or_create_encryption_key(self) -> bytes:
@@ -47,19 +89,60 @@ class Database:
 
     def _encrypt(self, data: str) -> str:
         """Encrypt sensitive data."""
-        f = Fernet(self.encryption_key)
-        return f.encrypt(data.encode()).decode()
+        return self._fernet.encrypt(data.encode()).decode()
 
     def _decrypt(self, encrypted_data: str) -> str:
-        """Decrypt sensitive data."""
-        f = Fernet(self.encryption_key)
-        return f.decrypt(encrypted_data.encode()).decode()
+        """Decrypt sensitive data, reusing the result for ciphertexts seen before."""
+        data = self._decrypted.get(encrypted_data)
+        if data is None:
+            data = self._fernet.decrypt(encrypted_data.encode()).decode()
+            if len(self._decrypted) >= CREDENTIAL_CACHE_SIZE:
+                self._decrypted.clear()
+            self._decrypted[encrypted_data] = data
+        return data
+
+    def _forget_credentials(self, cursor: sqlite3.Cursor, telegram_id: int):
+        """Drop a user's cached plaintext credentials before they are changed or removed."""
+        cursor.execute('SELECT aspen_username, aspen_password FROM users WHERE telegram_id = ?', (telegram_id,))
+        row = cursor.fetchone()
+        if row:
+            self._decrypted.pop(row['aspen_username'], None)
+            self._decrypted.pop(row['aspen_password'], None)
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's long-lived connection, opening it with the pragmas on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, cached_statements=STATEMENT_CACHE_SIZE)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA cache_size=-20000')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            conn.execute('PRAGMA mmap_size=134217728')
+            self._local.conn = conn
+        elif conn.in_transaction:
+            # A previous call on this thread failed mid-write; drop its partial changes
+            conn.rollback()
+        return conn
 
     def init_database(self):
         """Initialize database tables."""
-        conn = sqlite3.connect(self.db_path)
+        conn = self._connect()
         cursor = conn.cursor()
 
+        # Page size and auto_vacuum only take effect on a database with no pages yet,
+        # and page_size can't change once the file is in WAL mode
+        if cursor.execute('PRAGMA page_count').fetchone()[0] == 0:
+            cursor.execute('PRAGMA page_size=4096')
+            cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+
+        # WAL is persistent in the database file, so it only needs setting once
+        cursor.execute('PRAGMA journal_mode=WAL')
+
+        # Run the schema setup and migrations as one transaction (one commit instead of one per
+        # statement). journal_mode can't change inside a transaction, so this starts after it
+        cursor.execute('BEGIN')
+
         # Users table
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS users (
@@ -75,19 +158,22 @@ class Database:
         ''')
 
         # User settings table for additional preferences
-        cursor.execute('''
+        cursor.execute(f'''
             CREATE TABLE IF NOT EXISTS user_settings (
                 telegram_id INTEGER PRIMARY KEY,
                 timezone TEXT DEFAULT 'America/Chicago',
                 notification_frequency TEXT DEFAULT 'daily',
-                notification_time TEXT DEFAULT '15:00',
+                notification_time INTEGER DEFAULT {DEFAULT_NOTIFICATION_SECONDS},
+                timezone_display TEXT,
                 FOREIGN KEY (telegram_id) REFERENCES users (telegram_id)
             )
         ''')
 
         # Add notification_time column if it doesn't exist (for existing databases)
         try:
-            cursor.execute('ALTER TABLE user_settings ADD COLUMN notification_time TEXT DEFAULT "15:00"')
+            cursor.execute(
+                f'ALTER TABLE user_settings ADD COLUMN notification_time INTEGER DEFAULT {DEFAULT_NOTIFICATION_SECONDS}'
+            )
             logger.info("Added notification_time column to existing user_settings table")
         except sqlite3.OperationalError as e:
             if "duplicate column name" in str(e):
@@ -95,6 +181,45 @@ class Database:
             else:
                 logger.warning(f"Could not add notification_time column: {e}")
 
+        # Add timezone_display column if it doesn't exist (for existing databases)
+        try:
+            cursor.execute('ALTER TABLE user_settings ADD COLUMN timezone_display TEXT')
+            logger.info("Added timezone_display column to existing user_settings table")
+        except sqlite3.OperationalError as e:
+            if "duplicate column name" in str(e):
+                logger.info("timezone_display column already exists")
+            else:
+                logger.warning(f"Could not add timezone_display column: {e}")
+
+        # Convert 'H:MM'/'HH:MM' notification times to seconds since midnight. SQLite can't change a
+        # column's type in place, so rebuild the table when the column still has TEXT affinity
+        columns = {row['name']: row['type'] for row in cursor.execute('PRAGMA table_info(user_settings)')}
+        if columns.get('notification_time', '').upper() == 'TEXT':
+            cursor.execute(f'''
+                CREATE TABLE user_settings_new (
+                    telegram_id INTEGER PRIMARY KEY,
+                    timezone TEXT DEFAULT 'America/Chicago',
+                    notification_frequency TEXT DEFAULT 'daily',
+                    notification_time INTEGER DEFAULT {DEFAULT_NOTIFICATION_SECONDS},
+                    timezone_display TEXT,
+                    FOREIGN KEY (telegram_id) REFERENCES users (telegram_id)
+                )
+            ''')
+            cursor.execute('''
+                INSERT INTO user_settings_new
+                (telegram_id, timezone, notification_frequency, notification_time, timezone_display)
+                SELECT telegram_id, timezone, notification_frequency,
+                       CASE WHEN instr(notification_time, ':') > 0
+                            THEN CAST(substr(notification_time, 1, instr(notification_time, ':') - 1) AS INTEGER) * 3600
+                                 + CAST(substr(notification_time, instr(notification_time, ':') + 1) AS INTEGER) * 60
+                       END,
+                       timezone_display
+                FROM user_settings
+            ''')
+            cursor.execute('DROP TABLE user_settings')
+            cursor.execute('ALTER TABLE user_settings_new RENAME TO user_settings')
+            logger.info("Converted notification_time to seconds since midnight")
+
         # Fix existing users with invalid timestamps
         try:
             # Fix various invalid timestamp formats
@@ -120,42 +245,47 @@ class Database:
             )
         ''')
 
+        # Indexes for active-user scans and recent-feedback lookups
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_active ON users(telegram_id) WHERE is_active = 1')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_feedback_created ON feedback(created_at DESC)')
+
         conn.commit()
-        conn.close()
+
+        # Refresh planner statistics where they are missing or stale (cheap when nothing changed)
+        cursor.execute('PRAGMA optimize')
+
+        # Reclaim any free pages left behind since the last start
+        conn.executescript('PRAGMA incremental_vacuum')
         logger.info("Database initialized successfully")
 
     def add_user(self, telegram_id: int, aspen_username: str, aspen_password: str,
                  notification_method: str = 'telegram') -> bool:
         """Add or update user credentials."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
             # Encrypt credentials
             encrypted_username = self._encrypt(aspen_username)
             encrypted_password = self._encrypt(aspen_password)
 
-            # Check if user exists
-            cursor.execute('SELECT telegram_id FROM users WHERE telegram_id = ?', (telegram_id,))
-            existing_user = cursor.fetchone()
-
-            if existing_user:
-                # Update existing user
-                cursor.execute('''
-                    UPDATE users
-                    SET aspen_username = ?, aspen_password = ?, notification_method = ?, last_updated = ?
-                    WHERE telegram_id = ?
-                ''', (encrypted_username, encrypted_password, notification_method, datetime.utcnow(), telegram_id))
-            else:
-                # Insert new user
-                cursor.execute('''
-                    INSERT INTO users
-                    (telegram_id, aspen_username, aspen_password, notification_method, created_at, last_updated)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (telegram_id, encrypted_username, encrypted_password, notification_method, datetime.utcnow(), datetime.utcnow()))
+            # Drop the old credentials' plaintext from the cache before they are replaced
+            self._forget_credentials(cursor, telegram_id)
+
+            # Insert new user, or update credentials in place (created_at and is_active are kept)
+            now = datetime.utcnow()
+            cursor.execute('''
+                INSERT INTO users
+                (telegram_id, aspen_username, aspen_password, notification_method, created_at, last_updated)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(telegram_id) DO UPDATE SET
+                    aspen_username = excluded.aspen_username,
+                    aspen_password = excluded.aspen_password,
+                    notification_method = excluded.notification_method,
+                    last_updated = excluded.last_updated
+            ''', (telegram_id, encrypted_username, encrypted_password, notification_method, now, now))
 
             conn.commit()
-            conn.close()
             logger.info(f"User {telegram_id} added/updated successfully")
             return True
 
@@ -166,52 +296,144 @@ class Database:
     def get_user(self, telegram_id: int) -> Optional[Dict[str, Any]]:
         """Get user data by telegram ID."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
-            cursor.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,))
+            cursor.execute('''
+                SELECT telegram_id, aspen_username, aspen_password, notification_method,
+                       is_active, created_at, last_updated
+                FROM users WHERE telegram_id = ?
+            ''', (telegram_id,))
             user = cursor.fetchone()
-            conn.close()
 
             if user:
-                return {
-                    'telegram_id': user[0],
-                    'aspen_username': self._decrypt(user[1]),
-                    'aspen_password': self._decrypt(user[2]),
-                    'notification_method': user[3],
-                    'is_active': bool(user[5]),  # Fixed: was user[4], should be user[5]
-                    'created_at': user[6],        # Fixed: was user[5], should be user[6]
-                    'last_updated': user[7]       # Fixed: was user[6], should be user[7]
-                }
+                return self._user_from_row(user)
             return None
 
         except Exception as e:
             logger.error(f"Error getting user {telegram_id}: {e}")
             return None
 
+    def user_exists(self, telegram_id: int) -> bool:
+        """Check whether a user is registered without reading their credentials."""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+
+            cursor.execute('SELECT 1 FROM users WHERE telegram_id = ? LIMIT 1', (telegram_id,))
+            exists = cursor.fetchone() is not None
+
+            return exists
+
+        except Exception as e:
+            logger.error(f"Error checking user {telegram_id}: {e}")
+            return False
+
+    def _user_from_row(self, user: sqlite3.Row) -> Dict[str, Any]:
+        """Build a user dict from a users row, decrypting the credentials."""
+        return {
+            'telegram_id': user['telegram_id'],
+            'aspen_username': self._decrypt(user['aspen_username']),
+            'aspen_password': self._decrypt(user['aspen_password']),
+            'notification_method': user['notification_method'],
+            'is_active': bool(user['is_active']),
+            'created_at': user['created_at'],
+            'last_updated': user['last_updated']
+        }
+
+    def _user_with_settings(self, user: sqlite3.Row) -> Dict[str, Any]:
+        """Build a user dict from a users row joined with timezone, notification time and display."""
+        result = self._user_from_row(user)
+        result['timezone'] = user['timezone'] or 'America/Chicago'
+        result['notification_seconds'] = user['notification_time'] if user['notification_time'] is not None else DEFAULT_NOTIFICATION_SECONDS
+        result['notification_time'] = seconds_to_time(result['notification_seconds'])
+        result['timezone_display'] = user['timezone_display']
+        return result
+
+    def get_user_with_settings(self, telegram_id: int) -> Optional[Dict[str, Any]]:
+        """Get user data together with timezone and notification time in one query."""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+
+            cursor.execute(USER_WITH_SETTINGS_BY_ID_QUERY, (telegram_id,))
+            user = cursor.fetchone()
+
+            if user:
+                return self._user_with_settings(user)
+            return None
+
+        except Exception as e:
+            logger.error(f"Error getting user with settings {telegram_id}: {e}")
+            return None
+
+    def iter_all_users_with_settings(self) -> Iterator[Dict[str, Any]]:
+        """Stream all active users with their settings from a single JOIN query."""
+        cursor = self._connect().execute(ACTIVE_USERS_WITH_SETTINGS_QUERY)
+        for user in cursor:
+            yield self._user_with_settings(user)
+
+    def get_all_users_with_settings(self) -> List[Dict[str, Any]]:
+        """Get all active users with their settings."""
+        try:
+            return list(self.iter_all_users_with_settings())
+        except Exception as e:
+            logger.error(f"Error getting all users with settings: {e}")
+            return []
+
+    def get_notification_hour_counts(self) -> Dict[int, int]:
+        """Count active users per notification hour, bucketed inside SQLite."""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+
+            cursor.execute('''
+                SELECT COALESCE(s.notification_time, ?) / 3600 AS hour, COUNT(*)
+                FROM users u
+                LEFT JOIN user_settings s USING (telegram_id)
+                WHERE u.is_active = 1
+                GROUP BY hour
+            ''', (DEFAULT_NOTIFICATION_SECONDS,))
+            counts = dict(cursor.fetchall())
+
+            return counts
+
+        except Exception as e:
+            logger.error(f"Error counting notification hours: {e}")
+            return {}
+
+    def get_active_users_page(self, limit: int, offset: int = 0) -> Tuple[List[Dict[str, Any]], int]:
+        """Get one page of active users with their settings, plus the total active user count."""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+
+            cursor.execute('SELECT COUNT(*) FROM users WHERE is_active = 1')
+            total = cursor.fetchone()[0]
+
+            cursor.execute(ACTIVE_USERS_PAGE_QUERY, (limit, offset))
+            users = cursor.fetchall()
+
+            return [self._user_with_settings(user) for user in users], total
+
+        except Exception as e:
+            logger.error(f"Error getting active users page: {e}")
+            return [], 0
+
     def get_all_active_users(self) -> List[Dict[str, Any]]:
         """Get all active users."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
-            cursor.execute('SELECT * FROM users WHERE is_active = 1')
+            cursor.execute('''
+                SELECT telegram_id, aspen_username, aspen_password, notification_method,
+                       is_active, created_at, last_updated
+                FROM users WHERE is_active = 1
+            ''')
             users = cursor.fetchall()
-            conn.close()
-
-            result = []
-            for user in users:
-                result.append({
-                    'telegram_id': user[0],
-                    'aspen_username': self._decrypt(user[1]),
-                    'aspen_password': self._decrypt(user[2]),
-                    'notification_method': user[3],
-                    'is_active': bool(user[5]),   # user[4] is email, user[5] is is_active
-                    'created_at': user[6],
-                    'last_updated': user[7]
-                })
-
-            return result
+
+            return [self._user_from_row(user) for user in users]
 
         except Exception as e:
             logger.error(f"Error getting all users: {e}")
@@ -220,7 +442,7 @@ class Database:
     def add_feedback(self, user_id: int, username: str, first_name: str, feedback_type: str, message: str) -> bool:
         """Add feedback to database."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
             cursor.execute('''
@@ -229,7 +451,6 @@ class Database:
             ''', (user_id, username, first_name, feedback_type, message))
 
             conn.commit()
-            conn.close()
             logger.info(f"Feedback added from user {user_id}")
             return True
 
@@ -240,7 +461,7 @@ class Database:
     def get_feedback(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get recent feedback messages."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
             cursor.execute('''
@@ -251,20 +472,8 @@ class Database:
             ''', (limit,))
 
             feedback_list = cursor.fetchall()
-            conn.close()
 
-            result = []
-            for feedback in feedback_list:
-                result.append({
-                    'user_id': feedback[0],
-                    'username': feedback[1],
-                    'first_name': feedback[2],
-                    'feedback_type': feedback[3],
-                    'message': feedback[4],
-                    'created_at': feedback[5]
-                })
-
-            return result
+            return [dict(feedback) for feedback in feedback_list]
 
         except Exception as e:
             logger.error(f"Error getting feedback: {e}")
@@ -273,7 +482,7 @@ class Database:
     def update_user_notification_method(self, telegram_id: int, method: str) -> bool:
         """Update user's notification method."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
             cursor.execute('''
@@ -283,7 +492,6 @@ class Database:
             ''', (method, datetime.utcnow(), telegram_id))
 
             conn.commit()
-            conn.close()
             return cursor.rowcount > 0
 
         except Exception as e:
@@ -295,20 +503,20 @@ class Database:
     def get_user_settings(self, telegram_id: int) -> Optional[Dict[str, Any]]:
         """Get user settings."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
-            cursor.execute('SELECT * FROM user_settings WHERE telegram_id = ?', (telegram_id,))
+            cursor.execute('''
+                SELECT telegram_id, timezone, notification_frequency, notification_time, timezone_display
+                FROM user_settings WHERE telegram_id = ?
+            ''', (telegram_id,))
             settings = cursor.fetchone()
-            conn.close()
 
             if settings:
-                return {
-                    'telegram_id': settings[0],
-                    'timezone': settings[1],
-                    'notification_frequency': settings[2],
-                    'notification_time': settings[3]
-                }
+                settings = dict(settings)
+                if settings['notification_time'] is not None:
+                    settings['notification_time'] = seconds_to_time(settings['notification_time'])
+                return settings
             return None
 
         except Exception as e:
@@ -317,60 +525,52 @@ class Database:
 
     def update_user_notification_time(self, telegram_id: int, notification_time: str) -> bool:
         """Update user's notification time."""
+        return self.update_user_settings(
+            telegram_id, notification_frequency='daily', notification_time=notification_time
+        )
+
+    def update_user_timezone(self, telegram_id: int, timezone: str, display: Optional[str] = None) -> bool:
+        """Update user's timezone and the display name shown for it."""
+        return self.update_user_settings(
+            telegram_id, timezone=timezone, timezone_display=display, notification_frequency='daily'
+        )
+
+    def update_user_settings(self, telegram_id: int, **fields) -> bool:
+        """Update several user settings in one statement, creating the row if needed."""
         try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-
-            # Get current timezone or use default
-            current_settings = self.get_user_settings(telegram_id)
-            timezone = current_settings.get('timezone', 'America/Chicago') if current_settings else 'America/Chicago'
-
-            # Insert or update user settings
-            cursor.execute('''
-                INSERT OR REPLACE INTO user_settings
-                (telegram_id, timezone, notification_frequency, notification_time)
-                VALUES (?, ?, ?, ?)
-            ''', (telegram_id, timezone, 'daily', notification_time))
-
-            conn.commit()
-            conn.close()
-            return True
+            unknown = set(fields) - SETTINGS_COLUMNS
+            if unknown or not fields:
+                raise ValueError(f"Invalid settings fields: {sorted(unknown) or 'none given'}")
+            if 'notification_time' in fields:
+                fields['notification_time'] = time_to_seconds(fields['notification_time'])
 
-        except Exception as e:
-            logger.error(f"Error updating notification time for {telegram_id}: {e}")
-            return False
+            columns = list(fields)
+            placeholders = ", ".join("?" for _ in columns)
+            assignments = ", ".join(f"{column} = excluded.{column}" for column in columns)
 
-    def update_user_timezone(self, telegram_id: int, timezone: str) -> bool:
-        """Update user's timezone."""
-        try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
-            # Get current settings or use defaults
-            current_settings = self.get_user_settings(telegram_id)
-            notification_time = current_settings.get('notification_time', '15:00') if current_settings else '15:00'
-
-            # Insert or update user settings
-            cursor.execute('''
-                INSERT OR REPLACE INTO user_settings
-                (telegram_id, timezone, notification_frequency, notification_time)
-                VALUES (?, ?, ?, ?)
-            ''', (telegram_id, timezone, 'daily', notification_time))
+            cursor.execute(f'''
+                INSERT INTO user_settings (telegram_id, {", ".join(columns)})
+                VALUES (?, {placeholders})
+                ON CONFLICT(telegram_id) DO UPDATE SET {assignments}
+            ''', (telegram_id, *fields.values()))
 
             conn.commit()
-            conn.close()
             return True
 
         except Exception as e:
-            logger.error(f"Error updating timezone for {telegram_id}: {e}")
+            logger.error(f"Error updating settings for {telegram_id}: {e}")
             return False
 
     def deactivate_user(self, telegram_id: int) -> bool:
         """Deactivate user account."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
+            self._forget_credentials(cursor, telegram_id)
             cursor.execute('''
                 UPDATE users
                 SET is_active = 0, last_updated = ?
@@ -378,7 +578,6 @@ class Database:
             ''', (datetime.utcnow(), telegram_id))
 
             conn.commit()
-            conn.close()
             return cursor.rowcount > 0
 
         except Exception as e:
@@ -388,16 +587,20 @@ class Database:
     def delete_user(self, telegram_id: int) -> bool:
         """Delete user account completely."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
+            self._forget_credentials(cursor, telegram_id)
             cursor.execute('DELETE FROM users WHERE telegram_id = ?', (telegram_id,))
             affected_users = cursor.rowcount
             cursor.execute('DELETE FROM user_settings WHERE telegram_id = ?', (telegram_id,))
             affected_settings = cursor.rowcount
 
             conn.commit()
-            conn.close()
+
+            # Hand the freed pages back to the filesystem (auto_vacuum=INCREMENTAL). The pragma
+            # frees one page per step and execute() only steps once, so run it via executescript
+            conn.executescript('PRAGMA incremental_vacuum')
             return (affected_users + affected_settings) > 0
 
         except Exception as e:
@@ -407,12 +610,11 @@ class Database:
     def get_user_count(self) -> int:
         """Get total number of active users."""
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self._connect()
             cursor = conn.cursor()
 
             cursor.execute('SELECT COUNT(*) FROM users WHERE is_active = 1')
             count = cursor.fetchone()[0]
-            conn.close()
 
             return count
 
@@ -424,12 +626,16 @@ class Database:
         """Create backup of database."""
         try:
             from datetime import datetime
-            import shutil
 
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             backup_dir = os.path.dirname(self.db_path)
             backup_path = os.path.join(backup_dir, f"backup_users_{timestamp}.db")
-            shutil.copy2(self.db_path, backup_path)
+
+            # Use the online backup API so pages still in the WAL are included
+            conn = self._connect()
+            backup_conn = sqlite3.connect(backup_path)
+            conn.backup(backup_conn)
+            backup_conn.close()
 
             logger.info(f"Database backed up to {backup_path}")
             return backup_path
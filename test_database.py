@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+from database import Database
+
+
+class NotificationTimeMigrationTest(unittest.TestCase):
+    """init_database converts legacy TEXT notification times to seconds since midnight."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, "users.db")
+
+        # Schema as it was before notification_time became an INTEGER column
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript('''
+            CREATE TABLE user_settings (
+                telegram_id INTEGER PRIMARY KEY,
+                timezone TEXT DEFAULT 'America/Chicago',
+                notification_frequency TEXT DEFAULT 'daily',
+                notification_time TEXT DEFAULT '15:00',
+                timezone_display TEXT
+            );
+        ''')
+        conn.executemany(
+            'INSERT INTO user_settings (telegram_id, notification_time) VALUES (?, ?)',
+            [(1, '9:05'), (2, '09:05'), (3, '18:30'), (4, ''), (5, None)]
+        )
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_times_are_converted(self):
+        db = Database(self.db_path)
+
+        self.assertEqual(db.get_user_settings(1)['notification_time'], '09:05')
+        self.assertEqual(db.get_user_settings(2)['notification_time'], '09:05')
+        self.assertEqual(db.get_user_settings(3)['notification_time'], '18:30')
+        self.assertIsNone(db.get_user_settings(4)['notification_time'])
+        self.assertIsNone(db.get_user_settings(5)['notification_time'])
+
+        conn = sqlite3.connect(self.db_path)
+        stored = dict(conn.execute('SELECT telegram_id, notification_time FROM user_settings'))
+        conn.close()
+        self.assertEqual(stored[1], 9 * 3600 + 5 * 60)
+        self.assertEqual(stored[3], 18 * 3600 + 30 * 60)
+
+    def test_migration_runs_once(self):
+        Database(self.db_path)
+        db = Database(self.db_path)
+
+        self.assertEqual(db.get_user_settings(1)['notification_time'], '09:05')
+
+
+class FakeJobQueue:
+    """Records the arguments of the last run_daily call."""
+
+    def run_daily(self, callback, **kwargs):
+        self.kwargs = kwargs
+
+
+class SchedulerTest(unittest.TestCase):
+    """Weekday job registration and report coalescing in bot.scheduler."""
+
+    @classmethod
+    def setUpClass(cls):
+        # bot.scheduler opens ./users.db at import; keep it out of the working tree
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cwd = os.getcwd()
+        os.chdir(cls.tmpdir.name)
+        try:
+            import bot.scheduler as scheduler
+        finally:
+            os.chdir(cwd)
+        cls.scheduler = scheduler
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def _schedule(self, notification_time, tz_name, now_utc):
+        """Schedule one user as if the clock read now_utc, returning the run_daily kwargs."""
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return now_utc.astimezone(tz)
+
+        hour, minute = map(int, notification_time.split(':'))
+        user = {
+            'telegram_id': 7,
+            'notification_time': notification_time,
+            'notification_seconds': hour * 3600 + minute * 60,
+            'timezone': tz_name,
+        }
+        job_queue = FakeJobQueue()
+        with mock.patch.object(self.scheduler, 'datetime', FrozenDatetime):
+            self.scheduler.schedule_user_job(job_queue, user)
+        return job_queue.kwargs
+
+    def test_evening_job_shifts_to_next_utc_day(self):
+        # 20:00 in Chicago is 01:00 UTC the next day, so Mon-Fri local is Tue-Sat UTC
+        kwargs = self._schedule('20:00', 'America/Chicago', datetime(2026, 10, 14, 12, 0, tzinfo=timezone.utc))
+        self.assertEqual(kwargs['days'], (2, 3, 4, 5, 6))
+        self.assertEqual(kwargs['time'].hour, 1)
+
+    def test_morning_job_keeps_weekdays(self):
+        kwargs = self._schedule('09:00', 'America/Chicago', datetime(2026, 10, 14, 12, 0, tzinfo=timezone.utc))
+        self.assertEqual(kwargs['days'], (1, 2, 3, 4, 5))
+        self.assertEqual(kwargs['time'].hour, 14)
+
+    def test_saturday_first_run_moves_to_monday(self):
+        # Saturday 07:00 in Chicago; the 09:00 run would land on the weekend
+        kwargs = self._schedule('09:00', 'America/Chicago', datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc))
+        next_run = kwargs['job_kwargs']['next_run_time']
+        self.assertEqual(next_run.date().isoformat(), '2026-10-19')
+        self.assertEqual(next_run.weekday(), 0)
+        self.assertEqual(next_run.hour, 14)
+
+    def test_coalesce_packs_parts_under_limit(self):
+        messages = ['a' * 3000, 'b' * 900, 'c' * 3000, 'd' * 10]
+        coalesced = self.scheduler.coalesce_messages(messages)
+
+        self.assertEqual(coalesced, ['a' * 3000 + '\n' + 'b' * 900, 'c' * 3000 + '\n' + 'd' * 10])
+        self.assertTrue(all(len(m) <= self.scheduler.MESSAGE_COALESCE_LIMIT for m in coalesced))
+
+    def test_coalesce_handles_empty_and_single(self):
+        self.assertEqual(self.scheduler.coalesce_messages([]), [])
+        self.assertEqual(self.scheduler.coalesce_messages(['only']), ['only'])
+
+
+if __name__ == "__main__":
+    unittest.main()